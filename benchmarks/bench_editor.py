@@ -0,0 +1,250 @@
+"""编辑器热点路径基准：按键到预览的延迟、语法高亮、打开/保存吞吐量和峰值内存
+
+有显示器（或在 xvfb-run 下运行）时驱动真实的 MarkdownEditor；没有显示器或指定
+--headless 时直接测试渲染、分词和文件读写逻辑。结果以 JSON 输出，
+可以用 --compare 与之前保存的结果比较。
+
+用法: python benchmarks/bench_editor.py [--sizes 10 1024 10240] [--output result.json]
+                                       [--compare baseline.json] [--headless]
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from malemon import MarkdownEditor, PerfRecorder, line_start_offsets, offset_to_index, tokenize_markdown
+from malemon_core import MarkdownRenderer, write_file_atomic
+from bench_tokenizer import make_document
+
+# 数值越小越好的指标；其余指标（吞吐量）越大越好
+LOWER_IS_BETTER = ("keystroke_to_preview_ms", "first_preview_ms", "highlight_full_ms",
+                   "highlight_line_ms", "peak_memory_mb")
+GUI_TIMEOUT = 600  # 等待界面完成一项操作的最长时间（秒）
+
+
+def make_renderer():
+    """创建只用于渲染的编辑器对象（不创建任何组件）"""
+    editor = MarkdownEditor.__new__(MarkdownEditor)
+    editor._renderer = MarkdownRenderer()
+    editor._perf = PerfRecorder()
+    return editor
+
+
+def elapsed_ms(start):
+    return (time.perf_counter() - start) * 1000
+
+
+def megabytes_per_second(text, milliseconds):
+    return len(text.encode("utf-8")) / (1024 * 1024) / (milliseconds / 1000)
+
+
+def edit_middle(text):
+    """在文档中间的行尾插入一个字符，模拟一次按键"""
+    position = text.index("\n", len(text) // 2)
+    return text[:position] + "x" + text[position:], text.count("\n", 0, position)
+
+
+def run_headless(text, path):
+    """直接测试渲染、分词和文件读写逻辑"""
+    result = {}
+    renderer = make_renderer()
+    
+    start = time.perf_counter()
+    renderer.render_markdown_blocks(text)
+    result["first_preview_ms"] = elapsed_ms(start)
+    
+    # 缓存已经预热，只有被修改的块需要重新转换
+    edited, line = edit_middle(text)
+    start = time.perf_counter()
+    renderer.render_markdown_blocks(edited)
+    result["keystroke_to_preview_ms"] = elapsed_ms(start)
+    
+    # 高亮：分词并把偏移量换算为索引（不包括 Tk 的 tag_add）
+    start = time.perf_counter()
+    line_starts = line_start_offsets(text)
+    for _, token_start, token_end in tokenize_markdown(text):
+        offset_to_index(line_starts, token_start)
+        offset_to_index(line_starts, token_end)
+    result["highlight_full_ms"] = elapsed_ms(start)
+    
+    line_text = edited.split("\n", line + 1)[line]
+    start = time.perf_counter()
+    line_starts = line_start_offsets(line_text)
+    for _, token_start, token_end in tokenize_markdown(line_text):
+        offset_to_index(line_starts, token_start, line)
+        offset_to_index(line_starts, token_end, line)
+    result["highlight_line_ms"] = elapsed_ms(start)
+    
+    start = time.perf_counter()
+    write_file_atomic(path, text)
+    result["save_mb_per_s"] = megabytes_per_second(text, elapsed_ms(start))
+    
+    # 与 open_file 相同的分块读取（不包括插入编辑器）
+    start = time.perf_counter()
+    with open(path, 'r', encoding='utf-8') as file:
+        chunks = []
+        while True:
+            chunk = file.read(MarkdownEditor.LOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    result["open_mb_per_s"] = megabytes_per_second(text, elapsed_ms(start))
+    return result
+
+
+def wait_until(root, condition):
+    """处理界面事件直到条件成立"""
+    deadline = time.perf_counter() + GUI_TIMEOUT
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("等待界面超时")
+        root.update()
+        time.sleep(0.001)
+
+
+def preview_idle(app):
+    """修改都已经渲染并写入预览"""
+    task = app._scheduler.tasks["preview"]
+    return (task["after_id"] is None and app._updated_change_count == app._change_count
+            and app._render_done == app._render_generation and app._render_poll_id is None)
+
+
+def run_gui(app, root, text, path):
+    """驱动真实的编辑器：打开、按键、保存"""
+    result = {}
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(text)
+    
+    start = time.perf_counter()
+    app.start_loading(path)
+    wait_until(root, lambda: app._load_file is None)
+    result["open_mb_per_s"] = megabytes_per_second(text, elapsed_ms(start))
+    
+    wait_until(root, lambda: preview_idle(app))
+    result["first_preview_ms"] = elapsed_ms(start)
+    
+    # 按键：从插入字符到预览更新完成，包括调度器的延迟
+    _, line = edit_middle(text)
+    start = time.perf_counter()
+    app.editor.insert(f"{line + 1}.end", "x")
+    wait_until(root, lambda: preview_idle(app))
+    result["keystroke_to_preview_ms"] = elapsed_ms(start)
+    
+    start = time.perf_counter()
+    app.highlight_syntax(full=True)
+    result["highlight_full_ms"] = elapsed_ms(start)
+    
+    app.editor.insert(f"{line + 1}.end", "x")
+    start = time.perf_counter()
+    app.highlight_syntax()
+    result["highlight_line_ms"] = elapsed_ms(start)
+    
+    start = time.perf_counter()
+    app.save_file(wait=True)
+    result["save_mb_per_s"] = megabytes_per_second(text, elapsed_ms(start))
+    
+    # 丢弃修改，下一项测试不必询问是否保存
+    app.is_modified = False
+    return result
+
+
+def create_app():
+    """创建隐藏的编辑器窗口，没有显示器时返回 (None, None)"""
+    import tkinter as tk
+    from ttkbootstrap import Window
+    try:
+        root = Window(themename="litera")
+    except tk.TclError:
+        return None, None
+    root.withdraw()
+    return root, MarkdownEditor(root)
+
+
+def max_rss_mb():
+    """进程的峰值常驻内存，不支持的平台返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以 KB 为单位
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def compare(baseline, current):
+    """打印两次结果中各指标的变化"""
+    old_cases = {case["size_kb"]: case for case in baseline["cases"]}
+    print(f"{'大小':>10} {'指标':<26} {'基准':>12} {'本次':>12} {'变化':>8}")
+    for case in current["cases"]:
+        old = old_cases.get(case["size_kb"])
+        if old is None:
+            continue
+        for metric, value in case["metrics"].items():
+            if metric not in old["metrics"]:
+                continue
+            before = old["metrics"][metric]
+            ratio = value / before if before else float("inf")
+            better = ratio < 1 if metric in LOWER_IS_BETTER else ratio > 1
+            print(f"{case['size_kb']:>8}KB {metric:<26} {before:>12.2f} {value:>12.2f} "
+                  f"{ratio:>7.2f}x{'' if better or ratio == 1 else ' !'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[10, 1024, 10240], help="文档大小（KB）")
+    parser.add_argument("--output", help="把结果写入 JSON 文件（默认输出到标准输出）")
+    parser.add_argument("--compare", metavar="BASELINE", help="与之前保存的 JSON 结果比较")
+    parser.add_argument("--headless", action="store_true", help="不创建窗口，只测试渲染、分词和文件读写逻辑")
+    args = parser.parse_args()
+    
+    root = app = None
+    if not args.headless:
+        root, app = create_app()
+    
+    report = {
+        "mode": "gui" if app is not None else "headless",
+        "time": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cases": [],
+    }
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.md")
+        for size in args.sizes:
+            text = make_document(int(size * 1024))
+            run = run_headless if app is None else lambda text, path: run_gui(app, root, text, path)
+            metrics = run(text, path)
+            
+            # tracemalloc 会明显拖慢运行，峰值内存在单独的一轮中测量
+            tracemalloc.start()
+            run(text, path)
+            metrics["peak_memory_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+            report["cases"].append({"size_kb": size, "characters": len(text), "metrics": metrics})
+            print(f"{size:g}KB 完成", file=sys.stderr)
+    
+    report["max_rss_mb"] = max_rss_mb()
+    if root is not None:
+        root.destroy()
+    
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+    
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            compare(json.load(file), report)
+
+
+if __name__ == "__main__":
+    main()
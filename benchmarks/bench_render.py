@@ -0,0 +1,52 @@
+"""预览渲染基准：比较每次调用 markdown.markdown 与复用同一个 Markdown 转换器的耗时
+
+用法: python benchmarks/bench_render.py [--sizes 0.5 2 20] [--count 50]
+"""
+import argparse
+import os
+import sys
+import time
+
+import markdown
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from malemon_core import MARKDOWN_EXTENSIONS
+from bench_tokenizer import make_document
+
+
+def per_call(text):
+    """旧版做法：每次渲染都重新创建转换器和所有扩展"""
+    return markdown.markdown(text, extensions=MARKDOWN_EXTENSIONS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[0.5, 2, 20], help="文档大小（KB）")
+    parser.add_argument("--count", type=int, default=50, help="每项渲染次数")
+    args = parser.parse_args()
+    
+    start = time.perf_counter()
+    for _ in range(args.count):
+        converter = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    setup = (time.perf_counter() - start) / args.count * 1000
+    print(f"创建转换器并加载扩展: {setup:.2f} ms")
+    
+    def reused(text):
+        return converter.reset().convert(text)
+    
+    print(f"{'大小':>8} {'每次创建 ms':>12} {'复用 ms':>10} {'加速比':>8}")
+    for size in args.sizes:
+        text = make_document(int(size * 1024))
+        assert per_call(text) == reused(text)
+        timings = []
+        for func in (per_call, reused):
+            start = time.perf_counter()
+            for _ in range(args.count):
+                func(text)
+            timings.append((time.perf_counter() - start) / args.count * 1000)
+        print(f"{size:>6.1f}KB {timings[0]:>12.2f} {timings[1]:>10.2f} {timings[0] / timings[1]:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""启动基准：多次启动编辑器，统计从启动到窗口可以编辑的耗时
+
+需要显示器（或在 xvfb-run 下运行）。每次启动使用 malemon.py --measure-startup，
+同时给出包括解释器启动在内的进程总耗时。
+
+用法: python benchmarks/bench_startup.py [--count 10]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+MALEMON = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "malemon.py")
+
+
+def launch():
+    """启动一次编辑器，返回 (窗口可以编辑的耗时, 进程总耗时)，单位毫秒"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, MALEMON, "--measure-startup"],
+                            capture_output=True, text=True, encoding="utf-8")
+    total = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"退出码 {result.returncode}")
+    # 输出格式: 启动耗时: 123.4 ms
+    return float(result.stdout.split()[1]), total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=10, help="启动次数")
+    args = parser.parse_args()
+    
+    # 第一次启动会编译字节码并填充系统的文件缓存，不计入结果
+    launch()
+    samples = [launch() for _ in range(args.count)]
+    
+    print(f"{'':>12} {'最小 ms':>10} {'中位数 ms':>10}")
+    for name, values in (("窗口可编辑", [s[0] for s in samples]), ("进程总耗时", [s[1] for s in samples])):
+        values.sort()
+        print(f"{name:>12} {values[0]:>10.1f} {values[len(values) // 2]:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""语法高亮扫描基准：比较逐个构造的十一次正则扫描与单次扫描分词器的吞吐量
+
+用法: python benchmarks/bench_tokenizer.py [--sizes 1 4 8] [--repeat 3]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from malemon import tokenize_markdown
+
+# 旧版 highlight_syntax 对整个文档依次执行的十一个正则
+LEGACY_PATTERNS = [
+    ("header", re.compile(r'^(#{1,6})[\t ]+(.+)$', re.MULTILINE)),
+    ("bold-italic", re.compile(r'\*\*\*(.*?)\*\*\*')),
+    ("bold", re.compile(r'(?<!\*)\*\*(?!\*)(.*?)(?<!\*)\*\*(?!\*)')),
+    ("italic", re.compile(r'(?<!\*)\*(?!\*)(.*?)(?<!\*)\*(?!\*)')),
+    ("bold", re.compile(r'__(.*?)__')),
+    ("italic", re.compile(r'_(.*?)_')),
+    ("code_block", re.compile(r'```[\s\S]*?```')),
+    ("code_inline", re.compile(r'`[^`\n]+`')),
+    ("link", re.compile(r'\[.*?\]\([^\)\n]*\)')),
+    ("list", re.compile(r'^[\t ]*([*+-]|\d+\.)[\t ]+', re.MULTILINE)),
+    ("quote", re.compile(r'^>.*$', re.MULTILINE)),
+]
+
+SAMPLE_BLOCKS = [
+    "# 第 {n} 章\n\n",
+    "普通段落，包含 **加粗**、*斜体*、`行内代码` 和 [链接](https://example.com/{n})。\n",
+    "- 列表项 {n}，带有 _强调_\n  1. 嵌套的有序列表 __加粗__\n",
+    "> 引用文字 {n}，其中有 ***加粗斜体***\n\n",
+    "```python\ndef f(x):\n    return x * 2 + {n}  # 代码中的 *星号* 不应被高亮\n```\n\n",
+    "| 列 A | 列 B |\n|------|------|\n| {n} | `值` |\n\n",
+    "一段没有任何标记的长文本，只用来模拟正文内容，编号 {n}，继续写一些文字以增加长度。\n",
+]
+
+
+def legacy_tokenize(text):
+    """旧版的逐构造扫描"""
+    spans = []
+    for tag, pattern in LEGACY_PATTERNS:
+        for match in pattern.finditer(text):
+            spans.append((tag, match.start(), match.end()))
+    return spans
+
+
+def make_document(size, seed=0):
+    """生成大约 size 个字符的 Markdown 文档"""
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    n = 0
+    while length < size:
+        block = rng.choice(SAMPLE_BLOCKS).format(n=n)
+        parts.append(block)
+        length += len(block)
+        n += 1
+    return "".join(parts)
+
+
+def measure(func, text, repeat):
+    """返回多次运行中的最短耗时（秒）和生成的标记数"""
+    best = None
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = len(list(func(text)))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 4, 8], help="文档大小（MB）")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最短耗时")
+    args = parser.parse_args()
+    
+    print(f"{'大小':>8} {'旧版 MB/s':>12} {'分词器 MB/s':>12} {'加速比':>8}")
+    for size in args.sizes:
+        text = make_document(int(size * 1024 * 1024))
+        megabytes = len(text.encode("utf-8")) / (1024 * 1024)
+        legacy_time, _ = measure(legacy_tokenize, text, args.repeat)
+        token_time, _ = measure(tokenize_markdown, text, args.repeat)
+        print(f"{megabytes:>6.1f}MB {megabytes / legacy_time:>12.1f} "
+              f"{megabytes / token_time:>12.1f} {legacy_time / token_time:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,523 @@
+import sys
+import time
+
+STARTUP_TIME = time.perf_counter()  # 开始导入本文件的时间，用于测量启动耗时
+
+# 批量转换不需要图形界面，在导入 Tk 和 ttkbootstrap 之前处理。
+# 以 __main__ 身份运行 malemon_core，工作进程启动时只会重新导入它，不会导入本文件
+if __name__ == "__main__" and sys.argv[1:2] == ["convert"]:
+    import runpy
+    del sys.argv[1]
+    runpy.run_module("malemon_core", run_name="__main__", alter_sys=True)
+    sys.exit()
+
 import tkinter as tk
 from tkinter import ttk, filedialog, font, messagebox
-import markdown
 from ttkbootstrap import Window
 from ttkbootstrap.utility import enable_high_dpi_awareness
-from tkhtmlview import HTMLLabel
+import argparse
+import bisect
+import contextlib
+import functools
+import itertools
+import json
 import os
 import re
-import sys
+import threading
+import zlib
+from collections import deque
+
+from malemon_core import HIGHLIGHT_CACHE, MarkdownRenderer, content_key, write_file_atomic
+
+# Markdown 语法高亮的单次扫描模式：
+# 行首的块级元素以换行符开头，行内元素以各自的起始字符开头，
+# 这样正则引擎可以直接跳到候选字符处再尝试匹配
+MARKDOWN_TOKEN_PATTERN = re.compile(
+    r'\n(?:(?P<fence>[\t ]*```)'
+    r'|(?P<header>#{1,6}[\t ]+[^\n]+)'
+    r'|(?P<quote>>[^\n]*)'
+    r'|(?P<list>[\t ]*(?:[*+-]|\d+\.)[\t ]+))'
+    r'|`(?P<code_inline>[^`\n]+`)'
+    r'|\[(?P<link>[^\n]*?\]\([^)\n]*\))'
+    r'|\*(?:(?P<bold_italic>\*\*[^\n]*?\*\*\*)'
+    r'|(?<!\*\*)(?:(?P<bold>\*(?!\*)[^\n]*?(?<!\*)\*\*(?!\*))'
+    r'|(?P<italic>(?!\*)[^\n]*?(?<!\*)\*(?!\*))))'
+    r'|_(?:(?P<underline_bold>_[^\n]*?__)|(?P<underline_italic>[^\n]*?_))'
+)
+FENCE_CLOSE_PATTERN = re.compile(r'\n[\t ]*```[^\n]*')
+HEADING_PATTERN = re.compile(r'^(#{1,6})[\t ]+([^\n]+)', re.MULTILINE)  # 与高亮使用相同的标题规则
+TOKEN_TAG_NAMES = {"bold_italic": "bold-italic", "underline_bold": "bold", "underline_italic": "italic"}
+
+
+def tokenize_markdown(text):
+    """单次扫描 Markdown 文本，依次生成 (标签, 起始偏移, 结束偏移)
+    
+    代码块内不再识别其他标记，行内代码和链接中不再识别强调；
+    标题和引用行内仍会继续识别行内标记。
+    """
+    # 在开头补一个换行符，使第一行也能匹配块级元素
+    text = "\n" + text
+    search = MARKDOWN_TOKEN_PATTERN.search
+    pos = 0
+    while True:
+        match = search(text, pos)
+        if match is None:
+            return
+        kind = match.lastgroup
+        start, end = match.span(kind)
+        
+        if kind == "fence":
+            # 找到配对的结束围栏，未闭合的围栏按普通文本处理
+            close = FENCE_CLOSE_PATTERN.search(text, end)
+            if close is None:
+                pos = end
+            else:
+                yield "code_block", start - 1, close.end() - 1
+                pos = close.end()
+        elif kind == "header" or kind == "quote":
+            # 整行高亮，然后继续扫描行内标记
+            yield kind, start - 1, end - 1
+            pos = start
+        elif kind == "list":
+            yield kind, start - 1, end - 1
+            pos = end
+        else:
+            yield TOKEN_TAG_NAMES.get(kind, kind), match.start() - 1, end - 1
+            pos = end
+
+
+def merge_dirty_lines(dirty, start, end, delta):
+    """把一次修改（修改后的行 [start, end) 发生变化，增加了 delta 行）合并到已有的记录中
+    
+    记录为 [起始行, 结束行, 增加的行数]，行号是修改后的行号；dirty 为 None 表示没有修改。
+    """
+    if dirty is None:
+        return [start, end, delta]
+    
+    # 把之前记录的范围映射到修改后的行号再合并
+    first, last, total = dirty
+    old_end = end - delta
+    last = last + delta if last > old_end else end
+    return [min(first, start), max(last, end), total + delta]
+
+
+def line_start_offsets(text):
+    """返回文本中每一行第一个字符的偏移量"""
+    offsets = [0]
+    offsets.extend(itertools.accumulate(len(line) + 1 for line in text.split("\n")[:-1]))
+    return offsets
+
+
+def offset_to_index(line_starts, offset, first_line=0):
+    """把字符偏移量转换为 Text 组件的 "行.列" 索引，first_line 为文本第一行的行号（从0开始）"""
+    line = bisect.bisect_right(line_starts, offset) - 1
+    return f"{first_line + line + 1}.{offset - line_starts[line]}"
+
+
+def find_headings(text, first_line=0):
+    """找出文本中的所有标题，返回 (行号, 级别, 标题文字) 列表，first_line 为文本第一行的行号"""
+    headings = []
+    line = first_line
+    pos = 0
+    for match in HEADING_PATTERN.finditer(text):
+        line += text.count("\n", pos, match.start())
+        pos = match.start()
+        # 去掉标题末尾可选的 # 号
+        title = match.group(2).rstrip().rstrip("#").rstrip() or match.group(2).strip()
+        headings.append((line, len(match.group(1)), title))
+    return headings
+
+
+def find_matches(text, query, regex=False, case_sensitive=False, candidates=None):
+    """在文本中查找所有匹配，返回 (起始偏移, 结束偏移) 列表
+    
+    candidates 为较短查询的匹配列表时，只检查这些位置（输入查询时逐步缩小结果）。
+    正则表达式有误时抛出 re.error。
+    """
+    if not query:
+        return []
+    
+    if not regex and case_sensitive:
+        # 区分大小写的普通文本直接用 str.find / str.startswith
+        length = len(query)
+        matches = []
+        if candidates is not None:
+            for start, _ in candidates:
+                # 与 str.find 的结果一致，匹配之间不重叠
+                if (not matches or start >= matches[-1][1]) and text.startswith(query, start):
+                    matches.append((start, start + length))
+            return matches
+        find = text.find
+        start = find(query)
+        while start != -1:
+            matches.append((start, start + length))
+            start = find(query, start + length)
+        return matches
+    
+    pattern = re.compile(query if regex else re.escape(query), 0 if case_sensitive else re.IGNORECASE)
+    if candidates is not None:
+        matches = []
+        for start, _ in candidates:
+            if not matches or start >= matches[-1][1]:
+                match = pattern.match(text, start)
+                if match:
+                    matches.append(match.span())
+        return matches
+    # 跳过空匹配，避免在同一位置反复匹配
+    return [match.span() for match in pattern.finditer(text) if match.end() > match.start()]
+
+
+def replace_matches(text, query, replacement, regex=False, case_sensitive=False):
+    """一次性替换文本中的所有匹配，返回 (新文本, 替换次数)
+    
+    匹配规则与 find_matches 相同；正则模式下 replacement 可以引用分组（如 \\1）。
+    """
+    if not query:
+        return text, 0
+    
+    if not regex and case_sensitive:
+        count = text.count(query)
+        return text.replace(query, replacement), count
+    
+    pattern = re.compile(query if regex else re.escape(query), 0 if case_sensitive else re.IGNORECASE)
+    count = 0
+    
+    def substitute(match):
+        nonlocal count
+        if match.end() == match.start():
+            # 与查找一致，忽略空匹配
+            return ""
+        count += 1
+        return match.expand(replacement) if regex else replacement
+    
+    return pattern.sub(substitute, text), count
+
+
+def process_exists(pid):
+    """判断进程是否还在运行，用于区分崩溃留下的日志和其他正在运行的实例的日志"""
+    if not isinstance(pid, int) or pid <= 0:
+        return False
+    if os.name == "nt":
+        # Windows 上 os.kill 会结束进程，改为打开进程查询退出码
+        import ctypes
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return ctypes.get_last_error() == 5  # ERROR_ACCESS_DENIED：进程存在但无权访问
+        try:
+            code = ctypes.c_ulong()
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(code))) and code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except PermissionError:
+        return True  # 进程存在，属于其他用户
+    except OSError:
+        return False
+    return True
+
+
+@contextlib.contextmanager
+def locked_file(path):
+    """在 path 上持有跨进程的独占锁，串行化多个实例对同一文件的读-改-写"""
+    with open(path, 'a') as file:
+        if os.name == "nt":
+            import msvcrt
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)  # 关闭文件时释放
+            yield
+
+
+class PreviewRegion:
+    """让 tkhtmlview 的解析器把 HTML 写入预览组件中的一段区域
+    
+    解析器总是在组件末尾追加内容，并用 "end-1c" 之类的索引检查已经写入的文本。
+    这里把这些索引换算到区域的起止标记上，并给标签名加上前缀以免与其他块冲突。
+    区域必须从一行的开头开始。
+    """
+    
+    END_OFFSET_PATTERN = re.compile(r'^end-(\d+)c$')
+    
+    def __init__(self, widget, prefix, start_mark, end_mark):
+        self.widget = widget
+        self.prefix = prefix
+        self.start_mark = start_mark
+        self.end_mark = end_mark
+        self.start_line = int(widget.index(start_mark).split(".")[0])
+        self.tags = []
+    
+    def translate(self, index):
+        """把解析器使用的索引换算为组件中的实际索引"""
+        index = str(index)
+        if index in (tk.END, tk.INSERT):
+            return self.end_mark
+        match = self.END_OFFSET_PATTERN.match(index)
+        if match:
+            # 区域的结束标记相当于组件的 "end-1c"，不能越过区域的开头
+            actual = self.widget.index(f"{self.end_mark}-{int(match.group(1)) - 1}c")
+            if self.widget.compare(actual, "<", self.start_mark):
+                return self.start_mark
+            return actual
+        line, column = index.split(".")
+        actual = f"{self.start_line + int(line) - 1}.{column}"
+        # 与组件末尾的行为一致，超出区域的索引落在区域的结束标记上
+        if self.widget.compare(actual, ">", self.end_mark):
+            return self.end_mark
+        return actual
+    
+    def index(self, index):
+        line, column = self.widget.index(self.translate(index)).split(".")
+        return f"{int(line) - self.start_line + 1}.{column}"
+    
+    def get(self, start, end):
+        return self.widget.get(self.translate(start), self.translate(end))
+    
+    def insert(self, index, chars):
+        # 显式传入空的标签列表，避免继承两侧字符的标签
+        self.widget.insert(self.translate(index), chars, ())
+    
+    def delete(self, start, end):
+        self.widget.delete(self.translate(start), self.translate(end))
+    
+    def image_create(self, index, **kwargs):
+        self.widget.image_create(self.translate(index), **kwargs)
+    
+    def tag_add(self, tag, start, end):
+        name = self.prefix + tag
+        self.tags.append(name)
+        self.widget.tag_add(name, self.translate(start), self.translate(end))
+    
+    def tag_config(self, tag, **kwargs):
+        self.widget.tag_config(self.prefix + tag, **kwargs)
+    
+    def tag_bind(self, tag, sequence, func):
+        self.widget.tag_bind(self.prefix + tag, sequence, func)
+    
+    def config(self, **kwargs):
+        self.widget.config(**kwargs)
+    
+    def cget(self, key):
+        return self.widget.cget(key)
+
+
+class TaskScheduler:
+    """按名称调度延迟执行的任务：重新调度时取消尚未执行的同名任务
+    
+    每个任务记录最近的执行耗时，自适应任务的延迟随耗时变化，
+    小文档几乎立即更新，大文档则等待更长的输入停顿，避免反复执行昂贵的任务。
+    """
+    
+    COST_FACTOR = 3  # 延迟为平均耗时的倍数，使任务最多占用约四分之一的时间
+    COST_SMOOTHING = 0.3  # 新的耗时在平均值中的权重
+    
+    def __init__(self, root):
+        self.root = root
+        self.tasks = {}
+    
+    def add(self, name, func, min_delay, max_delay=None, external_cost=False):
+        """注册任务；max_delay 为 None 时延迟固定为 min_delay，0 表示空闲时立即执行
+        
+        external_cost 为 True 时 run 不记录耗时，由完成实际工作的一方调用 report_cost
+        （任务只是把工作交给其他线程时，同步部分的耗时会把平均值拉低）。
+        """
+        self.tasks[name] = {"func": func, "min_delay": min_delay, "max_delay": max_delay,
+                            "cost": 0.0, "after_id": None, "external_cost": external_cost}
+    
+    def delay(self, name):
+        """返回任务当前的延迟（毫秒）"""
+        task = self.tasks[name]
+        if task["max_delay"] is None:
+            return task["min_delay"]
+        return int(min(max(task["cost"] * self.COST_FACTOR, task["min_delay"]), task["max_delay"]))
+    
+    def schedule(self, name):
+        """（重新）调度任务，之前尚未执行的同名任务被取消"""
+        task = self.tasks[name]
+        if task["after_id"] is not None:
+            self.root.after_cancel(task["after_id"])
+        delay = self.delay(name)
+        if delay:
+            task["after_id"] = self.root.after(delay, self.run, name)
+        else:
+            task["after_id"] = self.root.after_idle(self.run, name)
+    
+    def cancel(self, name=None):
+        """取消一个或全部尚未执行的任务"""
+        for task_name in ([name] if name else list(self.tasks)):
+            task = self.tasks[task_name]
+            if task["after_id"] is not None:
+                self.root.after_cancel(task["after_id"])
+                task["after_id"] = None
+    
+    def run(self, name):
+        """执行任务并记录耗时"""
+        task = self.tasks[name]
+        task["after_id"] = None
+        start = time.perf_counter()
+        task["func"]()
+        if not task["external_cost"]:
+            self.report_cost(name, (time.perf_counter() - start) * 1000)
+    
+    def report_cost(self, name, cost):
+        """记录一次耗时（毫秒），也用于在其他线程中完成的工作"""
+        task = self.tasks[name]
+        task["cost"] += (cost - task["cost"]) * self.COST_SMOOTHING
+
+
+class PerfRecorder:
+    """记录各阶段的耗时直方图和文档规模，可选地把每次调用写入 JSON lines 文件
+    
+    渲染在后台线程中进行，所以记录时需要加锁。
+    """
+    
+    HISTOGRAM_BOUNDS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)  # 直方图各区间的上限（毫秒）
+    RECENT_SAMPLES = 1000  # 计算百分位数时使用的最近调用次数
+    
+    def __init__(self, log_path=None):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.log_file = open(log_path, 'a', encoding='utf-8', buffering=1) if log_path else None
+    
+    def record(self, stage, duration, size):
+        """记录一次调用的耗时（毫秒）和规模"""
+        with self.lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = {
+                    "count": 0, "total": 0.0, "max": 0.0, "size": 0,
+                    "buckets": [0] * (len(self.HISTOGRAM_BOUNDS) + 1),
+                    "recent": deque(maxlen=self.RECENT_SAMPLES),
+                }
+            stats["count"] += 1
+            stats["total"] += duration
+            stats["max"] = max(stats["max"], duration)
+            stats["size"] += size
+            stats["buckets"][bisect.bisect_left(self.HISTOGRAM_BOUNDS, duration)] += 1
+            stats["recent"].append(duration)
+            
+            if self.log_file is not None:
+                self.log_file.write(json.dumps({"time": time.time(), "stage": stage,
+                                                "ms": round(duration, 3), "size": size}) + "\n")
+    
+    def reset(self):
+        """清空已记录的统计"""
+        with self.lock:
+            self.stages.clear()
+    
+    def report(self):
+        """返回各阶段统计的文本报告"""
+        lines = []
+        with self.lock:
+            for stage, stats in sorted(self.stages.items()):
+                recent = sorted(stats["recent"])
+                p50 = recent[len(recent) // 2]
+                p95 = recent[min(len(recent) * 95 // 100, len(recent) - 1)]
+                lines.append(f"{stage}: {stats['count']} 次, 平均 {stats['total'] / stats['count']:.2f} ms, "
+                             f"p50 {p50:.2f} ms, p95 {p95:.2f} ms, 最大 {stats['max']:.2f} ms, "
+                             f"平均规模 {stats['size'] // stats['count']}")
+                
+                peak = max(stats["buckets"])
+                lower = 0
+                for bound, count in zip(self.HISTOGRAM_BOUNDS + (None,), stats["buckets"]):
+                    label = f"{lower}-{bound} ms" if bound is not None else f">{lower} ms"
+                    lower = bound
+                    if count:
+                        lines.append(f"    {label:>12} {'█' * max(1, count * 40 // peak)} {count}")
+                lines.append("")
+        return "\n".join(lines) if lines else "还没有记录"
+
+
+def timed(stage, size):
+    """记录方法耗时的装饰器，size(self, *args) 在调用后返回这次调用的规模"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self._perf.record(stage, (time.perf_counter() - start) * 1000, size(self, *args))
+        return wrapper
+    return decorator
+
 
 class MarkdownEditor:
     # 常量定义
     LIGHT_THEMES = ["litera", "minty", "simplex", "cerculean"]  # 所有浅色主题
     DARK_THEMES = ["vapor", "darkly"]  # 所有深色主题
     THEMES = LIGHT_THEMES + DARK_THEMES  # 所有可用主题
+    # 浅色和深色主题的样式表：编辑器颜色和各语法标签的样式
+    LIGHT_STYLES = {
+        "editor": {"bg": "#ffffff", "fg": "#000000", "insertbackground": "black"},
+        "tags": {
+            "header": {"foreground": "#0066cc"},
+            "bold-italic": {"foreground": "#cc5500", "font": ("", 14, "bold italic")},
+            "bold": {"foreground": "#cc2222", "font": ("", 14, "bold")},
+            "italic": {"foreground": "#00aa00", "font": ("", 14, "italic")},
+            "code_block": {"background": "#f5f5f5", "foreground": "#333333"},
+            "code_inline": {"background": "#e8e8e8", "foreground": "#000000"},
+            "link": {"foreground": "#cc6600"},
+            "list": {"foreground": "#9900cc"},
+            "quote": {"foreground": "#006699", "font": ("", 14, "italic")},
+        },
+    }
+    DARK_STYLES = {
+        "editor": {"bg": "#2d2d2d", "fg": "#ffffff", "insertbackground": "white"},
+        "tags": {
+            "header": {"foreground": "#66ccff"},
+            "bold-italic": {"foreground": "#ffaa66", "font": ("", 14, "bold italic")},
+            "bold": {"foreground": "#ff7777", "font": ("", 14, "bold")},
+            "italic": {"foreground": "#77ff77", "font": ("", 14, "italic")},
+            "code_block": {"background": "#2a2a2a", "foreground": "#e6e6e6"},
+            "code_inline": {"background": "#3a3a3a", "foreground": "#ffffff"},
+            "link": {"foreground": "#ffcc66"},
+            "list": {"foreground": "#cc99ff"},
+            "quote": {"foreground": "#99ccff", "font": ("", 14, "italic")},
+        },
+    }
+    THEME_STYLES = {**dict.fromkeys(LIGHT_THEMES, LIGHT_STYLES), **dict.fromkeys(DARK_THEMES, DARK_STYLES)}
     PREVIEW_DEFAULT_HTML = "<h1>Markdown 预览</h1><p>开始编辑以查看预览...</p>"
-    def __init__(self, root):
+    SYNTAX_TAGS = ["header", "bold", "italic", "code_block", "code_inline", "link", "list", "quote", "bold-italic"]
+    FENCE_PATTERN = re.compile(r'^[\t ]*```', re.MULTILINE)
+    VIEWPORT_HIGHLIGHT_LINES = 10000  # 超过此行数时只高亮可见区域
+    VIEWPORT_MARGIN_LINES = 100  # 可见区域上下额外高亮的行数
+    RENDER_POLL_INTERVAL = 20  # 轮询后台渲染结果的间隔（毫秒）
+    LOAD_CHUNK_SIZE = 256 * 1024  # 打开文件时每次读取并插入的字符数
+    JOURNAL_SUFFIX = ".malemon-journal"  # 编辑日志文件的后缀，日志放在文档旁边
+    JOURNAL_POINTER = os.path.join(os.path.expanduser("~"), ".malemon-recovery")  # 记录所有编辑日志的位置（每行一个）
+    JOURNAL_DELAY = 1000  # 编辑停止多久后写入日志（毫秒）
+    JOURNAL_COMPACT_SIZE = 1024 * 1024  # 日志中的修改记录超过此大小（且超过文档大小）时压缩为快照
+    SEARCH_DELAY = 100  # 输入查找内容后多久开始查找（毫秒）
+    STATUS_DELAY = (50, 500)  # 修改后更新状态栏的最短和最长延迟（毫秒）
+    PREVIEW_DELAY = (30, 2000)  # 修改后更新预览的最短和最长延迟（毫秒），随渲染耗时调整
+    OUTLINE_DELAY = (100, 1000)  # 大纲面板打开时，修改后更新大纲的最短和最长延迟（毫秒）
+    PERF_REFRESH_INTERVAL = 1000  # 性能统计窗口的刷新间隔（毫秒）
+    ICON_FILES = ("icon-64.png", "icon.png")  # 按顺序查找的图标文件
+    WORD_PATTERN = re.compile(r'\b\w+\b')  # 统计单词数使用的模式（单词不会跨行）
+    WORDS_PER_MINUTE = 200  # 估算阅读时间使用的阅读速度
+    SEARCH_TAG_BATCH = 10000  # 每次 tag_add 调用标记的匹配数量
+    TAB_MEMORY_BUDGET = 64 * 1024 * 1024  # 非活动标签页估计占用的内存上限（字节），超出时淘汰缓存或把文本写入临时文件
+    TAB_BYTES_PER_CHAR = 4  # 估计编辑器中每个字符占用的内存（文本、行结构和撤销记录）
+    # 每个标签页各自的文档状态，切换标签页时保存和恢复
+    DOCUMENT_STATE = ("current_file", "is_modified", "_dirty_lines", "_fence_lines", "_pending_lines",
+                      "_synced_line", "_count_dirty_lines", "_line_words", "_line_chars", "_word_count",
+                      "_char_count", "_outline_dirty_lines", "_heading_lines", "_headings", "_change_count",
+                      "_updated_change_count", "_saved_change_count", "_journal_path", "_journal_edits",
+                      "_journal_size", "_journal_base_size", "_rendered_blocks")
+    def __init__(self, root, perf_log=None, measure_startup=False, highlight_cache=None):
         self.root = root
         self.root.title("Malemon")
         self.root.geometry("1200x800")
-        
-        # 设置应用程序图标
-        self.set_app_icon()
+        self._measure_startup = measure_startup  # 窗口可以编辑后输出启动耗时并退出
         
         # 文件路径
         self.current_file = None
@@ -28,25 +525,133 @@ class MarkdownEditor:
         # 状态变量
         self.is_modified = False
         self.auto_preview_enabled = True
-        self.last_content = ""
-        self.after_id = None  # 用于存储定时器ID
+        
+        # 性能统计：highlight_syntax、render_markdown、set_html（写入预览）和字数统计的耗时
+        self._perf = PerfRecorder(perf_log)
+        self._perf_window = None
+        
+        # 修改后的更新任务：高亮立即执行，状态栏稍后，预览在输入停顿后
+        self._scheduler = TaskScheduler(self.root)
+        self._scheduler.add("highlight", self.update_highlight, 0)
+        self._scheduler.add("status", self.update_status, *self.STATUS_DELAY)
+        # 预览在后台线程渲染，耗时由 poll_preview 在渲染完成后报告
+        self._scheduler.add("preview", self.update_preview, *self.PREVIEW_DELAY, external_cost=True)
+        self._scheduler.add("outline", self.update_outline, *self.OUTLINE_DELAY)
+        self._dirty_lines = None  # 上次高亮后修改过的行 [起始行, 结束行, 增加的行数]
+        self._fence_lines = None  # 代码块围栏所在的行号（从0开始）
+        self._pending_lines = []  # 尚未高亮的行区间（大文档只高亮可见区域）
+        self._scroll_highlight_id = None  # 滚动后高亮可见区域的定时器ID
+        self._scroll_sync_id = None  # 滚动后同步预览位置的定时器ID
+        self._synced_line = None  # 上次同步预览时编辑器的第一个可见行
+        
+        # 按行统计的单词数和字符数，只重新统计修改过的行
+        self._count_dirty_lines = None  # 上次统计后修改过的行，格式同 _dirty_lines
+        self._line_words = None  # 每行的单词数，None 表示还没有统计过
+        self._line_chars = None  # 每行的字符数（不含换行符）
+        self._word_count = 0
+        self._char_count = 0  # 所有行的字符数之和（不含换行符）
+        
+        # 标题索引：按行号排序，只重新扫描修改过的行
+        self._outline_dirty_lines = None  # 上次更新索引后修改过的行，格式同 _dirty_lines
+        self._heading_lines = []  # 所有标题的行号（从0开始）
+        self._headings = []  # 与 _heading_lines 对应的 (级别, 标题文字)
+        self._outline = None  # 大纲面板的状态，None 表示面板没有打开
+        
+        # 后台预览渲染（只保留最新的请求）
+        self._render_condition = threading.Condition()
+        self._render_request = None  # 等待渲染的 (序号, 内容)
+        self._render_result = None  # 最新一次渲染得到的 (内容哈希, HTML) 块列表
+        self._render_cost = 0.0  # 最新一次渲染的耗时（毫秒）
+        self._render_generation = 0  # 最新请求的序号
+        self._render_done = 0  # 已完成渲染的最新请求序号
+        self._render_thread = None
+        self._render_poll_id = None  # 轮询渲染结果的定时器ID
+        self._renderer = MarkdownRenderer()  # 转换器和顶层块缓存（只在渲染线程中使用）
+        self._highlight_cache_path = highlight_cache  # 保存代码块高亮缓存的文件，None 表示不保存
+        self._preview_blocks = None  # 预览中按顺序写入的块记录，None 表示预览不是按块写入的
+        self._preview_block_lines = []  # 预览中各块在源文本中的起始行号
+        self._preview_block_id = 0  # 用于生成块标记名的计数器
+        self._rendered_blocks = None  # 预览中显示的当前文档的块列表，切换回标签页时不必重新渲染
+        
+        # 分块打开文件
+        self._load_file = None  # 正在读取的文件对象，None 表示没有正在打开的文件
+        self._load_path = None
+        self._load_size = 0  # 文件的字节数，用于显示进度
+        self._load_after_id = None  # 读取下一块的定时器ID
+        
+        # 修改检测：编辑器命令代理每次修改文本时增加计数，不需要比较整个文档
+        self._change_count = 0  # 编辑器内容被修改的次数
+        self._updated_change_count = 0  # 上次更新预览和状态时的修改次数
+        self._saved_change_count = 0  # 与磁盘上的文件一致时的修改次数，None 表示不一致
+        
+        # 后台保存（保存过程中的多次保存合并为一次）
+        self._save_condition = threading.Condition()
+        self._save_request = None  # 等待写入的 (序号, 路径, 内容, 修改次数)
+        self._save_result = None  # 最近一次写入的 (路径, 修改次数, 异常)
+        self._save_generation = 0  # 最新请求的序号
+        self._save_done = 0  # 已完成写入的最新请求序号
+        self._save_thread = None
+        self._save_poll_id = None  # 轮询保存结果的定时器ID
+        
+        # 自动保存的编辑日志（记录修改而不是整个文档）
+        self._journal_condition = threading.Condition()
+        self._journal_tasks = []  # 等待日志线程处理的任务
+        self._journal_busy = False  # 日志线程是否正在处理任务
+        self._journal_thread = None
+        self._journal_path = None  # 当前日志文件的路径，None 表示还没有创建日志
+        self._journal_edits = []  # 尚未写入日志的修改记录
+        self._journal_size = 0  # 日志中修改记录的字节数
+        self._journal_base_size = 0  # 日志基准内容（文件或快照）的字符数
+        self._journal_after_id = None  # 写入日志的定时器ID
+        self._journal_paused = False  # 恢复日志时不再记录修改
+        self._journal_session = os.urandom(4).hex()  # 本次运行的编号，未命名文档的日志不会与上次留下的重名
+        
+        # 查找
+        self._search = None  # 查找窗口的状态，None 表示查找窗口没有打开
+        
+        # 已应用样式表的主题
+        self._styled_theme = None
+        
+        # 标签页：当前文档的状态保存在上面的属性中，其他标签页的状态保存在各自的记录里
+        self._tabs = []  # 标签页记录，顺序与标签栏一致
+        self._active_tab = None
+        self._tab_id = 0  # 用于生成标签页编号（未命名文档的日志文件名）
+        self._tab_clock = 0  # 标签页被激活的次数，用于找出最久没有使用的标签页
         
         # 创建组件和菜单
         self.create_main_widgets()
+        self.create_tab()
         self.create_menu_bar()
         self.bind_events()
         
-        # 更新主题标签
+        # 更新主题标签和语法标签样式
         self.theme_label.config(text=f"主题: {self.root.style.theme.name}")
-        
-        # 初始内容 - 修改为空
-        self.update_preview_and_status()
-        
-        # 初始语法高亮
-        self.highlight_syntax()
+        self.apply_theme_styles(self.root.style.theme.name)
         
         # 初始更新标题
         self.update_title()
+        
+        # 检查上次是否有未保存的编辑（测量启动耗时时不处理日志）
+        if not measure_startup:
+            self.recover_journal()
+        
+        # 图标、预览组件和 Markdown 转换器在窗口显示后再准备
+        self.root.after_idle(self.finish_startup)
+    
+    def finish_startup(self):
+        """窗口第一次显示后再进行的启动工作"""
+        # 先完成窗口的布局和绘制，此时编辑器已经可以输入
+        self.root.update_idletasks()
+        elapsed = (time.perf_counter() - STARTUP_TIME) * 1000
+        self._perf.record("startup", elapsed, 0)
+        if self._measure_startup:
+            print(f"启动耗时: {elapsed:.1f} ms", flush=True)
+            self.root.destroy()
+            return
+        
+        self.set_app_icon()
+        self.create_preview()
+        self.start_render_worker()
     
     def set_app_icon(self):
         """设置应用程序图标"""
@@ -54,15 +659,17 @@ class MarkdownEditor:
             # 尝试获取打包后的资源路径
             if hasattr(sys, '_MEIPASS'):
                 # PyInstaller打包后的资源目录
-                icon_path = os.path.join(sys._MEIPASS, "icon.png")
+                resource_dir = sys._MEIPASS
             else:
                 # 开发环境下的资源路径
-                script_dir = os.path.dirname(os.path.abspath(__file__))
-                icon_path = os.path.join(script_dir, "icon.png")
+                resource_dir = os.path.dirname(os.path.abspath(__file__))
             
-            # 如果图标文件存在，则设置为应用程序图标
-            if os.path.exists(icon_path):
-                self.root.iconphoto(False, tk.PhotoImage(file=icon_path))
+            # 优先使用缩小后的图标，解码原图（1024x1024）要慢得多
+            for name in self.ICON_FILES:
+                icon_path = os.path.join(resource_dir, name)
+                if os.path.exists(icon_path):
+                    self.root.iconphoto(False, tk.PhotoImage(file=icon_path))
+                    break
         except Exception as e:
             # 如果设置图标失败，不进行任何操作（避免影响程序正常运行）
             pass
@@ -85,36 +692,17 @@ class MarkdownEditor:
         # 创建分割窗格
         paned_window = ttk.PanedWindow(main_frame, orient=tk.HORIZONTAL)
         paned_window.pack(fill=tk.BOTH, expand=True, pady=5)
+        self._paned_window = paned_window
         
         # 左侧编辑区域
         editor_frame = ttk.LabelFrame(paned_window, text="编辑器", padding=5)
         paned_window.add(editor_frame, weight=1)
         
-        # 创建编辑器框架（包含Text和Scrollbar）
-        editor_container = ttk.Frame(editor_frame)
-        editor_container.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-        
-        # 创建滚动条
-        editor_scroll_y = ttk.Scrollbar(editor_container)
-        editor_scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
-        
-        editor_scroll_x = ttk.Scrollbar(editor_container, orient=tk.HORIZONTAL)
-        editor_scroll_x.pack(side=tk.BOTTOM, fill=tk.X)
-        
-        # 创建编辑器
-        self.editor = tk.Text(editor_container, 
-                             wrap=tk.WORD,
-                             font=("Consolas", 14),
-                             undo=True,
-                             padx=10,
-                             pady=10,
-                             yscrollcommand=editor_scroll_y.set,
-                             xscrollcommand=editor_scroll_x.set)
-        self.editor.pack(fill=tk.BOTH, expand=True)
-        
-        # 配置滚动条
-        editor_scroll_y.config(command=self.editor.yview)
-        editor_scroll_x.config(command=self.editor.xview)
+        # 标签页，每个文档一个编辑器（见 create_tab），Ctrl+Tab 切换
+        self.notebook = ttk.Notebook(editor_frame)
+        self.notebook.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.notebook.enable_traversal()
+        self.notebook.bind("<<NotebookTabChanged>>", lambda e: self.on_tab_changed())
         
         # 右侧预览区域
         preview_frame = ttk.LabelFrame(paned_window, text="预览", padding=5)
@@ -124,10 +712,9 @@ class MarkdownEditor:
         preview_container = ttk.Frame(preview_frame)
         preview_container.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
-        # 创建预览区域
-        self.preview = HTMLLabel(preview_container, 
-                               html=self.PREVIEW_DEFAULT_HTML)
-        self.preview.pack(fill=tk.BOTH, expand=True)
+        # 预览区域在窗口显示后再创建（见 create_preview）
+        self._preview_container = preview_container
+        self.preview = None
         
         # 创建状态栏
         status_frame = ttk.Frame(main_frame)
@@ -139,6 +726,249 @@ class MarkdownEditor:
         self.theme_label = ttk.Label(status_frame, text="", font=("Arial", 9))
         self.theme_label.pack(side=tk.RIGHT, padx=5)
     
+    def create_editor(self, parent):
+        """在 parent 中创建编辑器和滚动条，返回 (编辑器, 垂直滚动条, 编辑器原来的命令名)"""
+        # 创建滚动条
+        scroll_y = ttk.Scrollbar(parent)
+        scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        scroll_x = ttk.Scrollbar(parent, orient=tk.HORIZONTAL)
+        scroll_x.pack(side=tk.BOTTOM, fill=tk.X)
+        
+        # 创建编辑器
+        editor = tk.Text(parent,
+                         wrap=tk.WORD,
+                         font=("Consolas", 14),
+                         undo=True,
+                         padx=10,
+                         pady=10,
+                         xscrollcommand=scroll_x.set)
+        editor.pack(fill=tk.BOTH, expand=True)
+        
+        # 只有当前标签页的编辑器滚动时才需要高亮可见区域和同步预览
+        def on_scroll(first, last):
+            if editor is self.editor:
+                self.on_editor_scroll(first, last)
+            else:
+                scroll_y.set(first, last)
+        editor.config(yscrollcommand=on_scroll)
+        
+        # 配置滚动条
+        scroll_y.config(command=editor.yview)
+        scroll_x.config(command=editor.xview)
+        
+        editor.bind("<Control-h>", lambda e: self.replace_text())  # 覆盖 Text 默认的退格绑定
+        
+        # 内容变化由编辑器命令代理通知，点击和移动光标不会触发更新
+        editor.bind("<<Selection>>", lambda e: self.update_status_counts())
+        
+        # 记录编辑器中被修改的行，用于增量语法高亮
+        command = self.intercept_editor_changes(editor)
+        if self._styled_theme is not None:
+            self.style_editor(editor, self.THEME_STYLES.get(self._styled_theme, self.LIGHT_STYLES))
+        return editor, scroll_y, command
+    
+    def create_tab(self):
+        """新建一个空白文档的标签页并切换过去"""
+        self._tab_id += 1
+        frame = ttk.Frame(self.notebook)
+        editor, scroll_y, command = self.create_editor(frame)
+        tab = {
+            "id": self._tab_id,
+            "frame": frame,
+            "editor": editor,  # 文本写入临时文件后为 None
+            "scroll_y": scroll_y,
+            "command": command,
+            # 非活动时保存的文档状态（见 DOCUMENT_STATE），活动标签页的状态在编辑器对象的属性中
+            "state": {
+                "current_file": None, "is_modified": False,
+                "_dirty_lines": None, "_fence_lines": [], "_pending_lines": [], "_synced_line": None,
+                "_count_dirty_lines": None, "_line_words": None, "_line_chars": None,
+                "_word_count": 0, "_char_count": 0,
+                "_outline_dirty_lines": None, "_heading_lines": [], "_headings": [],
+                "_change_count": 0, "_updated_change_count": 0, "_saved_change_count": 0,
+                "_journal_path": None, "_journal_edits": [], "_journal_size": 0, "_journal_base_size": 0,
+                "_rendered_blocks": None,
+            },
+            "last_used": 0,  # 最近一次激活时的 _tab_clock
+            "evicted": False,  # 渲染结果和高亮标记是否已经被淘汰
+            "spill": None,  # 保存文本的压缩临时文件，None 表示文本还在编辑器中
+            "text_size": 0,  # 估计编辑器占用的内存（字节）
+            "cache_size": 0,  # 渲染结果的大小（字节）
+        }
+        self._tabs.append(tab)
+        self.notebook.add(frame, text="未命名")
+        self.activate_tab(tab)
+        return tab
+    
+    def on_tab_changed(self):
+        """标签栏中选中了另一个标签页"""
+        selected = str(self.notebook.select())
+        for tab in self._tabs:
+            if str(tab["frame"]) == selected:
+                self.activate_tab(tab)
+                return
+    
+    def activate_tab(self, tab):
+        """切换到标签页：保存当前文档的状态，恢复目标文档的状态和预览"""
+        if tab is self._active_tab:
+            return
+        if self._active_tab is not None:
+            self.deactivate_tab(self._active_tab)
+        
+        self._active_tab = tab
+        self._tab_clock += 1
+        tab["last_used"] = self._tab_clock
+        if tab["spill"] is not None:
+            self.restore_spilled_tab(tab)
+        self.editor = tab["editor"]
+        self.editor_scroll_y = tab["scroll_y"]
+        self._editor_command = tab["command"]
+        for name in self.DOCUMENT_STATE:
+            setattr(self, name, tab["state"][name])
+        tab["state"] = None
+        tab["evicted"] = False
+        if str(self.notebook.select()) != str(tab["frame"]):
+            self.notebook.select(tab["frame"])
+        
+        if self._change_count or self.current_file is not None:
+            # 预览直接显示保留的渲染结果，没有结果（已被淘汰）或内容有变化时在后台重新渲染；
+            # 被淘汰的高亮标记和统计在这里重新计算
+            if self._rendered_blocks is not None:
+                self.create_preview()
+                self.patch_preview(self._rendered_blocks)
+            else:
+                self._updated_change_count = None
+            self.update_preview_and_status()
+        else:
+            # 新建的空白文档
+            if self.preview is not None:
+                self.reset_preview(self.PREVIEW_DEFAULT_HTML)
+            self.status_label.config(text="就绪 | 字符数: 0 | 单词数: 0")
+            self.update_outline()
+        self.update_title()
+        self.editor.focus_set()
+        self.enforce_tab_budget()
+    
+    def deactivate_tab(self, tab):
+        """把当前文档的状态保存到标签页记录中，停止针对它的后台工作"""
+        # 正在打开的文件被取消（与按 Esc 相同）
+        self.cancel_loading()
+        self._scheduler.cancel()
+        self.wait_for_save()
+        if self._journal_after_id is not None:
+            self.root.after_cancel(self._journal_after_id)
+        self.flush_journal()
+        self.close_search()
+        
+        # 还没有完成的渲染被丢弃，切换回来时重新渲染
+        if self._render_done != self._render_generation:
+            self._updated_change_count = None
+        self.cancel_preview()
+        
+        # 被取消的状态栏更新中包括修改标记
+        self.is_modified = self._change_count != self._saved_change_count
+        self.update_text_counts()
+        tab["state"] = {name: getattr(self, name) for name in self.DOCUMENT_STATE}
+        tab["text_size"] = (self._char_count + len(self._line_chars)) * self.TAB_BYTES_PER_CHAR
+        tab["cache_size"] = sum(len(html) for _, html, _ in self._rendered_blocks or ())
+    
+    def enforce_tab_budget(self):
+        """非活动标签页超出内存预算时，从最久没有使用的开始淘汰渲染结果和高亮标记，
+        仍然超出时把文本压缩写入临时文件"""
+        inactive = sorted((tab for tab in self._tabs if tab is not self._active_tab),
+                          key=lambda tab: tab["last_used"])
+        total = sum(tab["text_size"] + tab["cache_size"] for tab in inactive if tab["spill"] is None)
+        for tab in inactive:
+            if total <= self.TAB_MEMORY_BUDGET:
+                return
+            if tab["spill"] is None and not tab["evicted"]:
+                total -= tab["cache_size"]
+                self.evict_tab_caches(tab)
+        for tab in inactive:
+            if total <= self.TAB_MEMORY_BUDGET:
+                return
+            if tab["spill"] is None and self.spill_tab(tab):
+                total -= tab["text_size"]
+    
+    def evict_tab_caches(self, tab):
+        """丢弃非活动标签页的渲染结果、高亮标记和增量高亮的状态，激活时重新计算"""
+        for tag in self.SYNTAX_TAGS:
+            tab["editor"].tag_remove(tag, "1.0", tk.END)
+        tab["state"].update(_rendered_blocks=None, _dirty_lines=None, _fence_lines=None, _pending_lines=[])
+        tab["cache_size"] = 0
+        tab["evicted"] = True
+    
+    def spill_tab(self, tab):
+        """把非活动标签页的文本压缩写入临时文件并销毁它的编辑器（撤销记录随之丢弃）"""
+        import tempfile  # 只在超出内存预算时才需要
+        editor = tab["editor"]
+        content = editor.get("1.0", "end-1c")
+        try:
+            fd, path = tempfile.mkstemp(prefix="malemon-tab-", suffix=".zlib")
+            with os.fdopen(fd, 'wb') as file:
+                file.write(zlib.compress(content.encode("utf-8")))
+        except OSError:
+            # 写不了临时文件时文本留在内存中
+            return False
+        
+        for child in tab["frame"].winfo_children():
+            child.destroy()
+        self.root.tk.deletecommand(str(editor))
+        tab.update(editor=None, scroll_y=None, command=None, spill=path, cache_size=0, evicted=True)
+        # 按行统计的结果也不再保留，恢复后重新统计
+        tab["state"].update(_rendered_blocks=None, _dirty_lines=None, _fence_lines=None, _pending_lines=[],
+                            _count_dirty_lines=None, _line_words=None, _line_chars=None)
+        return True
+    
+    def restore_spilled_tab(self, tab):
+        """从临时文件读回文本，重新创建编辑器"""
+        with open(tab["spill"], 'rb') as file:
+            content = zlib.decompress(file.read()).decode("utf-8")
+        os.remove(tab["spill"])
+        editor, scroll_y, command = self.create_editor(tab["frame"])
+        
+        # 直接调用原来的命令插入，文本与写出前相同，不算作修改，也不记录日志
+        self.root.tk.call(command, "insert", "1.0", content)
+        editor.edit_reset()
+        editor.mark_set(tk.INSERT, "1.0")
+        tab.update(editor=editor, scroll_y=scroll_y, command=command, spill=None)
+    
+    def close_tab(self):
+        """关闭当前标签页，有未保存的修改时先询问；关闭最后一个标签页时新建空白文档"""
+        if self.is_modified and not self.ask_save_changes():
+            return "break"
+        
+        tab = self._active_tab
+        self.stop_loading()
+        self._scheduler.cancel()
+        self.wait_for_save()
+        self.discard_journal()
+        self.close_search()
+        self.cancel_preview()
+        
+        index = self._tabs.index(tab)
+        self._tabs.remove(tab)
+        self._active_tab = None
+        editor = str(tab["editor"])
+        self.notebook.forget(tab["frame"])
+        tab["frame"].destroy()
+        self.root.tk.deletecommand(editor)
+        
+        if self._tabs:
+            self.activate_tab(self._tabs[min(index, len(self._tabs) - 1)])
+        else:
+            self.create_tab()
+        return "break"
+    
+    def create_preview(self):
+        """创建预览组件；tkhtmlview 导入较慢，第一次需要时才导入"""
+        if self.preview is not None:
+            return
+        from tkhtmlview import HTMLLabel
+        self.preview = HTMLLabel(self._preview_container, html=self.PREVIEW_DEFAULT_HTML)
+        self.preview.pack(fill=tk.BOTH, expand=True)
+    
     def create_menu_bar(self):
         """创建菜单栏"""
         menubar = tk.Menu(self.root)
@@ -149,17 +979,19 @@ class MarkdownEditor:
         file_menu.add_command(label="打开", command=self.open_file, accelerator="Ctrl+O")
         file_menu.add_command(label="保存", command=self.save_file, accelerator="Ctrl+S")
         file_menu.add_command(label="另存为", command=self.save_file_as, accelerator="Ctrl+Shift+S")
+        file_menu.add_command(label="关闭标签页", command=self.close_tab, accelerator="Ctrl+W")
         file_menu.add_separator()
         file_menu.add_command(label="退出", command=self.on_closing, accelerator="Ctrl+Q")
         menubar.add_cascade(label="文件", menu=file_menu)
         
         # 编辑菜单
         edit_menu = tk.Menu(menubar, tearoff=0)
-        edit_menu.add_command(label="撤销", command=self.editor.edit_undo, accelerator="Ctrl+Z")
-        edit_menu.add_command(label="重做", command=self.editor.edit_redo, accelerator="Ctrl+Y")
+        edit_menu.add_command(label="撤销", command=lambda: self.editor.edit_undo(), accelerator="Ctrl+Z")
+        edit_menu.add_command(label="重做", command=lambda: self.editor.edit_redo(), accelerator="Ctrl+Y")
         edit_menu.add_separator()
         edit_menu.add_command(label="全选", command=self.select_all, accelerator="Ctrl+A")
         edit_menu.add_command(label="查找", command=self.find_text, accelerator="Ctrl+F")
+        edit_menu.add_command(label="替换", command=self.replace_text, accelerator="Ctrl+H")
         menubar.add_cascade(label="编辑", menu=edit_menu)
         
         # 工具菜单
@@ -193,6 +1025,10 @@ class MarkdownEditor:
         for theme in self.THEMES:
             theme_menu.add_command(label=theme, command=lambda t=theme: self.change_theme_directly(t))
         view_menu.add_cascade(label="切换主题", menu=theme_menu)
+        view_menu.add_command(label="大纲", command=self.toggle_outline, accelerator="Ctrl+Shift+O")
+        self.scroll_sync_var = tk.BooleanVar(value=True)
+        view_menu.add_checkbutton(label="预览随编辑器滚动", variable=self.scroll_sync_var)
+        view_menu.add_command(label="性能统计", command=self.show_perf_panel)
         
         menubar.add_cascade(label="视图", menu=view_menu)
         
@@ -205,20 +1041,19 @@ class MarkdownEditor:
     
     def bind_events(self):
         """绑定事件"""
-        # 绑定快捷键
+        # 绑定快捷键（编辑器自身的绑定见 create_editor）
         self.root.bind("<Control-n>", lambda e: self.new_file())
         self.root.bind("<Control-o>", lambda e: self.open_file())
         self.root.bind("<Control-s>", lambda e: self.save_file())
         self.root.bind("<Control-Shift-S>", lambda e: self.save_file_as())
+        self.root.bind("<Control-w>", lambda e: self.close_tab())
         self.root.bind("<Control-q>", lambda e: self.on_closing())
         self.root.bind("<Control-z>", lambda e: self.editor.edit_undo())
         self.root.bind("<Control-y>", lambda e: self.editor.edit_redo())
         self.root.bind("<Control-a>", lambda e: self.select_all())
         self.root.bind("<Control-f>", lambda e: self.find_text())
-        
-        # 绑定内容变化事件
-        self.editor.bind("<KeyRelease>", self.on_content_change)
-        self.editor.bind("<ButtonRelease-1>", self.on_content_change)
+        self.root.bind("<Control-Shift-O>", lambda e: self.toggle_outline())
+        self.root.bind("<Escape>", lambda e: self.cancel_loading())
         
         # 窗口关闭事件
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -245,198 +1080,765 @@ class MarkdownEditor:
             # 移动光标到中间位置
             self.editor.mark_set(tk.INSERT, f"{tk.INSERT} - {len(suffix)}c")
     
-    def highlight_syntax(self):
-        """实现简单的语法高亮"""
-        # 清除所有标签
-        for tag in ["header", "bold", "italic", "code_block", "code_inline", "link", "list", "quote", "bold-italic"]:
-            self.editor.tag_remove(tag, "1.0", tk.END)
+    def intercept_editor_changes(self, editor):
+        """拦截编辑器的 insert/delete/replace 命令，记录被修改的行；返回编辑器原来的命令名"""
+        widget = str(editor)
+        command = widget + "_orig"
+        self.root.tk.call("rename", widget, command)
+        
+        # 非活动标签页的编辑器（例如淘汰高亮标记时）直接转发，不属于当前文档的修改
+        def forward(*args):
+            if editor is self.editor:
+                return self.on_editor_command(*args)
+            return self.root.tk.call((command,) + args)
+        self.root.tk.createcommand(widget, forward)
+        return command
+    
+    def on_editor_command(self, *args):
+        """编辑器命令代理：转发所有命令，修改文本时记录受影响的行
         
-        # 获取所有文本
-        content = self.editor.get("1.0", tk.END)
+        转发的命令出错时照常抛出，Tk 自己的绑定（例如没有选中文本时复制）依赖这些错误。
+        """
+        call = self.root.tk.call
+        command = self._editor_command
+        if not args or args[0] not in ("insert", "delete", "replace"):
+            return call((command,) + args)
+        
+        if args[0] == "insert":
+            indices, chars = args[1:2], args[2::2]
+        elif args[0] == "delete":
+            indices, chars = args[1:], ()
+        else:
+            indices, chars = args[1:3], args[3::2]
         
-        # 高亮标题
-        for match in re.finditer(r'^(#{1,6})\s+(.+)$', content, re.MULTILINE):
-            start = f"1.0 + {match.start()} chars"
-            end = f"1.0 + {match.end()} chars"
-            self.editor.tag_add("header", start, end)
-        
-        # 高亮加粗
-        # 先匹配四个星号的加粗斜体
-        for match in re.finditer(r'\*\*\*(.*?)\*\*\*', content):
-            start = f"1.0 + {match.start()} chars"
-            end = f"1.0 + {match.end()} chars"
-            self.editor.tag_add("bold-italic", start, end)
-        
-        # 高亮普通加粗（两个星号）
-        for match in re.finditer(r'(?<!\*)\*\*(?!\*)(.*?)(?<!\*)\*\*(?!\*)', content):
-            start = f"1.0 + {match.start()} chars"
-            end = f"1.0 + {match.end()} chars"
-            self.editor.tag_add("bold", start, end)
-        
-        # 高亮斜体（单个星号，确保不是加粗的一部分）
-        for match in re.finditer(r'(?<!\*)\*(?!\*)(.*?)(?<!\*)\*(?!\*)', content):
-            start = f"1.0 + {match.start()} chars"
-            end = f"1.0 + {match.end()} chars"
-            self.editor.tag_add("italic", start, end)
-        
-        # 高亮下划线样式的加粗和斜体
-        for match in re.finditer(r'__(.*?)__', content):
-            start = f"1.0 + {match.start()} chars"
-            end = f"1.0 + {match.end()} chars"
-            self.editor.tag_add("bold", start, end)
-        
-        for match in re.finditer(r'_(.*?)_', content):
-            start = f"1.0 + {match.start()} chars"
-            end = f"1.0 + {match.end()} chars"
-            self.editor.tag_add("italic", start, end)
-        
-        # 高亮代码块
-        for match in re.finditer(r'```[\s\S]*?```', content):
-            start = f"1.0 + {match.start()} chars"
-            end = f"1.0 + {match.end()} chars"
-            self.editor.tag_add("code_block", start, end)
-        
-        # 高亮行内代码
-        for match in re.finditer(r'`[^`\n]+`', content):
-            start = f"1.0 + {match.start()} chars"
-            end = f"1.0 + {match.end()} chars"
-            self.editor.tag_add("code_inline", start, end)
-        
-        # 高亮链接
-        for match in re.finditer(r'\[.*?\]\([^\)]*\)', content):
-            start = f"1.0 + {match.start()} chars"
-            end = f"1.0 + {match.end()} chars"
-            self.editor.tag_add("link", start, end)
+        try:
+            line_count = int(str(call(command, "index", "end-1c")).split(".")[0])
+            start = min(int(str(call(command, "index", index)).split(".")[0]) for index in indices)
+            self.record_journal_edit(args)
+        except tk.TclError:
+            # 索引无效：命令本身会报告同样的错误
+            return call((command,) + args)
+        
+        result = call((command,) + args)
+        new_line_count = int(str(call(command, "index", "end-1c")).split(".")[0])
+        
+        # 修改后受影响的行：起始行加上插入的换行
+        start = min(start, line_count) - 1
+        newlines = sum(str(text).count("\n") for text in chars)
+        self.mark_lines_dirty(start, start + 1 + newlines, new_line_count - line_count)
+        return result
+    
+    def record_journal_edit(self, args):
+        """把一次 insert/delete/replace 转换为日志记录（索引在修改前解析为 "行.列"）"""
+        if self._journal_paused or self._load_file is not None:
+            return
+        call = self.root.tk.call
+        command = self._editor_command
+        
+        if args[0] == "insert":
+            index = str(call(command, "index", args[1]))
+            self._journal_edits.append(["i", index, "".join(str(text) for text in args[2::2])])
+        else:
+            start = str(call(command, "index", args[1]))
+            end = str(call(command, "index", args[2] if len(args) > 2 else f"{args[1]}+1c"))
+            self._journal_edits.append(["d", start, end])
+            if args[0] == "replace":
+                self._journal_edits.append(["i", start, "".join(str(text) for text in args[3::2])])
+        
+        if self._journal_after_id is not None:
+            self.root.after_cancel(self._journal_after_id)
+        self._journal_after_id = self.root.after(self.JOURNAL_DELAY, self.flush_journal)
+    
+    def get_journal_path(self):
+        """返回当前文档的日志文件路径，未命名文档的日志放在用户目录"""
+        if self.current_file:
+            directory, name = os.path.split(os.path.abspath(self.current_file))
+            return os.path.join(directory, f".{name}{self.JOURNAL_SUFFIX}")
+        # 每个未命名标签页有自己的日志
+        name = f".malemon-untitled-{self._journal_session}-{self._active_tab['id']}{self.JOURNAL_SUFFIX}"
+        return os.path.join(os.path.expanduser("~"), name)
+    
+    def flush_journal(self):
+        """把积累的修改记录交给日志线程追加到日志文件"""
+        self._journal_after_id = None
+        if not self._journal_edits:
+            return
+        
+        if self._journal_path is None:
+            # 第一次修改：日志以当前磁盘上的文件为基准
+            self._journal_path = self.get_journal_path()
+            header = {"path": self.current_file}
+            if self.current_file and os.path.exists(self.current_file):
+                stat = os.stat(self.current_file)
+                header.update(size=stat.st_size, mtime=stat.st_mtime_ns)
+            self._journal_base_size = header.get("size", 0)
+            self.queue_journal_task(("reset", self._journal_path, header, None))
+        
+        lines = "".join(json.dumps(edit, ensure_ascii=False) + "\n" for edit in self._journal_edits)
+        self._journal_edits = []
+        self._journal_size += len(lines)
+        self.queue_journal_task(("append", self._journal_path, lines))
+        
+        if self._journal_size > max(self.JOURNAL_COMPACT_SIZE, self._journal_base_size):
+            self.compact_journal()
+    
+    def compact_journal(self):
+        """用当前内容的快照替换日志中的修改记录"""
+        content = self.editor.get("1.0", "end-1c")
+        self._journal_edits = []
+        self._journal_size = 0
+        self._journal_base_size = len(content)
+        self._journal_path = self.get_journal_path()
+        self.queue_journal_task(("reset", self._journal_path, {"path": self.current_file}, content))
+    
+    def discard_journal(self, wait=False):
+        """删除当前日志（文档已保存或用户放弃了修改）"""
+        if self._journal_after_id is not None:
+            self.root.after_cancel(self._journal_after_id)
+            self._journal_after_id = None
+        self._journal_edits = []
+        self._journal_size = 0
+        if self._journal_path is not None:
+            self.queue_journal_task(("discard", self._journal_path))
+            self._journal_path = None
+        if wait:
+            with self._journal_condition:
+                while self._journal_tasks or self._journal_busy:
+                    self._journal_condition.wait()
+    
+    def queue_journal_task(self, task):
+        """把任务交给日志线程，文件读写不阻塞界面"""
+        with self._journal_condition:
+            self._journal_tasks.append(task)
+            self._journal_condition.notify_all()
+        
+        if self._journal_thread is None:
+            self._journal_thread = threading.Thread(target=self.journal_worker, daemon=True)
+            self._journal_thread.start()
+    
+    def journal_worker(self):
+        """日志线程：创建、追加和删除日志文件"""
+        file = None
+        while True:
+            with self._journal_condition:
+                self._journal_busy = False
+                self._journal_condition.notify_all()
+                while not self._journal_tasks:
+                    self._journal_condition.wait()
+                tasks = self._journal_tasks
+                self._journal_tasks = []
+                self._journal_busy = True
             
-        # 高亮列表
-        for match in re.finditer(r'^[\t ]*([*+-]|\d+\.)\s+', content, re.MULTILINE):
-            start = f"1.0 + {match.start()} chars"
-            end = f"1.0 + {match.end()} chars"
-            self.editor.tag_add("list", start, end)
-
-        # 高亮引用
-        for match in re.finditer(r'^>.*$', content, re.MULTILINE):
-            start = f"1.0 + {match.start()} chars"
-            end = f"1.0 + {match.end()} chars"
-            self.editor.tag_add("quote", start, end)
-        
-    def apply_syntax_highlighting_colors(self):
-        """应用语法高亮颜色（根据主题）"""
-        current_theme = self.root.style.theme.name
-        
-        if current_theme in self.DARK_THEMES:
-            self.editor.tag_config("header", foreground="#66ccff")
-            self.editor.tag_config("bold-italic", foreground="#ffaa66", font=("", 14, "bold italic"))
-            self.editor.tag_config("bold", foreground="#ff7777", font=("", 14, "bold"))
-            self.editor.tag_config("italic", foreground="#77ff77", font=("", 14, "italic"))
-            self.editor.tag_config("code_block", background="#2a2a2a", foreground="#e6e6e6")
-            self.editor.tag_config("code_inline", background="#3a3a3a", foreground="#ffffff")
-            self.editor.tag_config("link", foreground="#ffcc66")
-            self.editor.tag_config("list", foreground="#cc99ff")
-            self.editor.tag_config("quote", foreground="#99ccff", font=("", 14, "italic"))
+            for task in tasks:
+                # 自动保存失败不影响编辑，忽略文件错误
+                try:
+                    if file is not None and (task[0] != "append" or file.name != task[1]):
+                        file.close()
+                        file = None
+                    
+                    if task[0] == "reset":
+                        _, path, header, snapshot = task
+                        # 记录所属进程，其他实例启动时不会把仍在使用的日志当作崩溃留下的
+                        lines = json.dumps(dict(header, pid=os.getpid()), ensure_ascii=False) + "\n"
+                        if snapshot is not None:
+                            lines += json.dumps(["s", snapshot], ensure_ascii=False) + "\n"
+                        write_file_atomic(path, lines)
+                        self.update_journal_pointer(add=path)
+                    elif task[0] == "append":
+                        if file is None:
+                            file = open(task[1], 'a', encoding='utf-8')
+                        file.write(task[2])
+                        file.flush()
+                        os.fsync(file.fileno())
+                    else:
+                        if os.path.exists(task[1]):
+                            os.remove(task[1])
+                        self.update_journal_pointer(remove=task[1])
+                except OSError:
+                    pass
+    
+    def update_journal_pointer(self, add=None, remove=None):
+        """在指针文件中登记或移除一个日志，没有日志时删除指针文件（只在日志线程中调用）
+        
+        多个实例共享指针文件，读-改-写期间持有锁文件上的锁，避免互相覆盖对方的登记。
+        """
+        with locked_file(self.JOURNAL_POINTER + ".lock"):
+            self.write_journal_pointer(add, remove)
+    
+    def write_journal_pointer(self, add, remove):
+        """update_journal_pointer 在持有锁时执行的读-改-写"""
+        try:
+            with open(self.JOURNAL_POINTER, 'r', encoding='utf-8') as file:
+                paths = [line for line in file.read().split("\n") if line]
+        except FileNotFoundError:
+            paths = []
+        
+        if add is not None:
+            if add in paths:
+                return
+            paths.append(add)
         else:
-            self.editor.tag_config("header", foreground="#0066cc")
-            self.editor.tag_config("bold-italic", foreground="#cc5500", font=("", 14, "bold italic"))
-            self.editor.tag_config("bold", foreground="#cc2222", font=("", 14, "bold"))
-            self.editor.tag_config("italic", foreground="#00aa00", font=("", 14, "italic"))
-            self.editor.tag_config("code_block", background="#f5f5f5", foreground="#333333")
-            self.editor.tag_config("code_inline", background="#e8e8e8", foreground="#000000")
-            self.editor.tag_config("link", foreground="#cc6600")
-            self.editor.tag_config("list", foreground="#9900cc")
-            self.editor.tag_config("quote", foreground="#006699", font=("", 14, "italic"))
+            if remove not in paths:
+                return
+            paths.remove(remove)
+        
+        if paths:
+            write_file_atomic(self.JOURNAL_POINTER, "".join(path + "\n" for path in paths))
+        else:
+            os.remove(self.JOURNAL_POINTER)
+    
+    def recover_journal(self):
+        """启动时检查上次未正常关闭时留下的日志，询问是否恢复；每个日志恢复到自己的标签页"""
+        try:
+            with open(self.JOURNAL_POINTER, 'r', encoding='utf-8') as file:
+                journal_paths = [line for line in file.read().split("\n") if line]
+        except OSError:
+            return
+        
+        journals = []
+        for journal_path in journal_paths:
+            try:
+                with open(journal_path, 'r', encoding='utf-8') as file:
+                    lines = file.read().split("\n")
+                header = json.loads(lines[0])
+                if not isinstance(header, dict):
+                    raise ValueError("日志头不是对象")
+            except (OSError, ValueError):
+                # 日志已经不存在或无法读取，从指针中移除
+                self.queue_journal_task(("discard", journal_path))
+                continue
+            if header.get("pid") != os.getpid() and process_exists(header.get("pid")):
+                # 日志属于另一个正在运行的实例，既不恢复也不删除
+                continue
+            
+            # 崩溃时最后一行可能只写了一半，只使用完整的记录
+            edits = []
+            for line in lines[1:]:
+                try:
+                    edits.append(json.loads(line))
+                except ValueError:
+                    break
+            journals.append((journal_path, header, edits))
+        
+        if not journals:
+            return
+        names = "、".join(os.path.basename(header["path"]) if header.get("path") else "未命名"
+                         for _, header, _ in journals)
+        if not messagebox.askyesno("恢复", f"检测到上次未保存的编辑（{names}），是否恢复？"):
+            for journal_path, _, _ in journals:
+                self.queue_journal_task(("discard", journal_path))
+            return
+        
+        for journal_path, header, edits in journals:
+            # 当前标签页已经有内容时在新的标签页中恢复
+            if self.current_file is not None or self._change_count:
+                self.create_tab()
+            self.restore_journal(journal_path, header, edits)
+    
+    def restore_journal(self, journal_path, header, edits):
+        """在当前标签页中恢复一个日志：在文件内容或快照上重放修改"""
+        path = header.get("path")
+        self._journal_path = journal_path
+        try:
+            if edits and edits[0][0] == "s":
+                content = ""
+            elif path:
+                stat = os.stat(path)
+                if (stat.st_size, stat.st_mtime_ns) != (header.get("size"), header.get("mtime")):
+                    raise ValueError("文件在上次编辑后已被修改")
+                with open(path, 'r', encoding='utf-8') as file:
+                    content = file.read()
+            else:
+                content = ""
+        except (OSError, ValueError) as e:
+            messagebox.showerror("错误", f"无法恢复编辑: {str(e)}")
+            self.discard_journal()
+            return
+        
+        # 在文件内容上重放修改
+        self._journal_paused = True
+        try:
+            self.editor.insert("1.0", content)
+            for edit in edits:
+                if edit[0] == "s":
+                    self.editor.delete("1.0", tk.END)
+                    self.editor.insert("1.0", edit[1])
+                elif edit[0] == "i":
+                    self.editor.insert(edit[1], edit[2])
+                else:
+                    self.editor.delete(edit[1], edit[2])
+        finally:
+            self._journal_paused = False
+        self.editor.edit_reset()
+        
+        self.current_file = path
+        self._saved_change_count = None
+        self.update_preview_and_status()
+        self.discard_journal()
+        self.compact_journal()
+    
+    def mark_lines_dirty(self, start, end, delta):
+        """记录一次修改：修改后的行 [start, end) 发生变化，文档增加了 delta 行"""
+        self._change_count += 1
+        self._dirty_lines = merge_dirty_lines(self._dirty_lines, start, end, delta)
+        self._count_dirty_lines = merge_dirty_lines(self._count_dirty_lines, start, end, delta)
+        self._outline_dirty_lines = merge_dirty_lines(self._outline_dirty_lines, start, end, delta)
+        self.on_content_change()
+    
+    @timed("highlight_syntax", lambda self, *args: int(self.editor.index("end-1c").split(".")[0]))
+    def highlight_syntax(self, full=False):
+        """增量语法高亮：只重新处理修改过的行及其所在的代码块
+        
+        超大文档只高亮可见区域附近的行，其余的行在滚动到时再高亮。
+        """
+        line_count = int(self.editor.index("end-1c").split(".")[0])
+        
+        if full or self._fence_lines is None:
+            # 首次高亮或强制全量高亮
+            self.scan_fence_lines()
+            self._pending_lines = [(0, line_count)]
+        elif self._dirty_lines is not None:
+            start, new_end, delta = self._dirty_lines
+            old_end = new_end - delta
+            
+            # 扩展到修改前后所在代码块的边界
+            old_first, old_last = self.expand_to_fence_blocks(start, old_end)
+            parity_changed = self.update_fence_lines(start, old_end, new_end)
+            first, last = self.expand_to_fence_blocks(start, new_end)
+            first = min(first, old_first)
+            last = max(last, old_last + delta)
+            if parity_changed:
+                # 围栏数量的奇偶变化会影响之后所有代码块的配对
+                last = line_count
+            
+            self.shift_pending_lines(start, old_end, delta)
+            self.add_pending_lines(first, min(last, line_count))
+        
+        self._dirty_lines = None
+        
+        # 决定本次需要高亮的范围
+        if line_count > self.VIEWPORT_HIGHLIGHT_LINES:
+            top = int(self.editor.index("@0,0").split(".")[0]) - 1
+            bottom = int(self.editor.index(f"@0,{self.editor.winfo_height()}").split(".")[0])
+            window = (max(top - self.VIEWPORT_MARGIN_LINES, 0), min(bottom + self.VIEWPORT_MARGIN_LINES, line_count))
+        else:
+            window = (0, line_count)
+        
+        for first, last in self._pending_lines:
+            first, last = max(first, window[0]), min(last, window[1])
+            if first < last:
+                first, last = self.expand_to_fence_blocks(first, last)
+                self.highlight_lines(first, last, line_count)
+                self.remove_pending_lines(first, last)
+    
+    def scan_fence_lines(self):
+        """扫描整个文档，找出所有代码块围栏所在的行"""
+        content = self.editor.get("1.0", "end-1c")
+        self._fence_lines = []
+        line = pos = 0
+        for match in self.FENCE_PATTERN.finditer(content):
+            line += content.count("\n", pos, match.start())
+            pos = match.start()
+            self._fence_lines.append(line)
+    
+    def add_pending_lines(self, first, last):
+        """把行范围 [first, last) 加入待高亮的区间列表，并与相邻的区间合并"""
+        merged = []
+        for start, end in self._pending_lines:
+            if end < first or start > last:
+                merged.append((start, end))
+            else:
+                first, last = min(first, start), max(last, end)
+        merged.append((first, last))
+        merged.sort()
+        self._pending_lines = merged
+    
+    def remove_pending_lines(self, first, last):
+        """从待高亮的区间列表中去掉行范围 [first, last)"""
+        remaining = []
+        for start, end in self._pending_lines:
+            if start < first:
+                remaining.append((start, min(end, first)))
+            if end > last:
+                remaining.append((max(start, last), end))
+        self._pending_lines = remaining
+    
+    def shift_pending_lines(self, start, old_end, delta):
+        """修改前的行 [start, old_end) 被替换后，调整待高亮区间的行号"""
+        shifted = []
+        for first, last in self._pending_lines:
+            if first < start:
+                shifted.append((first, min(last, start)))
+            if last > old_end:
+                shifted.append((max(first, old_end) + delta, last + delta))
+        self._pending_lines = shifted
+    
+    def on_editor_scroll(self, first, last):
+        """编辑器滚动时更新滚动条，并在空闲时高亮新进入可见区域的行、同步预览位置"""
+        self.editor_scroll_y.set(first, last)
+        if self._pending_lines and self._scroll_highlight_id is None:
+            self._scroll_highlight_id = self.root.after_idle(self.highlight_visible_lines)
+        if self._scroll_sync_id is None and self.scroll_sync_var.get():
+            self._scroll_sync_id = self.root.after_idle(self.sync_preview_scroll)
+    
+    def sync_preview_scroll(self):
+        """把预览滚动到编辑器第一个可见行对应的位置"""
+        self._scroll_sync_id = None
+        # 第一个可见行没有变化时（例如在当前行输入文字）不改变预览，保留手动滚动的位置
+        line = int(self.editor.index("@0,0").split(".")[0]) - 1
+        if line != self._synced_line:
+            self._synced_line = line
+            self.scroll_preview_to_line(line)
+    
+    def highlight_visible_lines(self):
+        """高亮可见区域中尚未高亮的行"""
+        self._scroll_highlight_id = None
+        if self._load_file is None:
+            self.highlight_syntax()
+    
+    def update_fence_lines(self, start, old_end, new_end):
+        """更新代码块围栏所在的行号，返回围栏数量的奇偶是否发生变化"""
+        fences = self._fence_lines
+        lo = bisect.bisect_left(fences, start)
+        hi = bisect.bisect_left(fences, old_end)
+        
+        lines = self.editor.get(f"{start + 1}.0", f"{new_end}.end").split("\n") if start < new_end else []
+        added = [start + i for i, line in enumerate(lines) if self.FENCE_PATTERN.match(line)]
+        
+        delta = new_end - old_end
+        self._fence_lines = fences[:lo] + added + [i + delta for i in fences[hi:]]
+        
+        return (len(added) - (hi - lo)) % 2 == 1
+    
+    def find_fence_block(self, line):
+        """返回包含指定行的代码块 (开始围栏行, 结束围栏行)，不在代码块内时返回 None"""
+        fences = self._fence_lines
+        idx = bisect.bisect_right(fences, line) - 1
+        if idx < 0:
+            return None
+        # 围栏两两配对，偶数下标为开始围栏
+        if idx % 2 == 1:
+            if fences[idx] == line:
+                return fences[idx - 1], fences[idx]
+            return None
+        if idx + 1 < len(fences):
+            return fences[idx], fences[idx + 1]
+        # 未闭合的围栏不视为代码块
+        return None
+    
+    def expand_to_fence_blocks(self, first, last):
+        """把行范围 [first, last) 扩展到完整包含其两端所在的代码块"""
+        block = self.find_fence_block(first)
+        if block is not None:
+            first = block[0]
+        if last > first:
+            block = self.find_fence_block(last - 1)
+            if block is not None:
+                last = block[1] + 1
+        return first, last
+    
+    def highlight_lines(self, first, last, line_count):
+        """重新高亮 [first, last) 范围内的行"""
+        seg_start = f"{first + 1}.0"
+        seg_end = f"{last + 1}.0" if last < line_count else tk.END
+        
+        # 清除范围内的标签
+        for tag in self.SYNTAX_TAGS:
+            self.editor.tag_remove(tag, seg_start, seg_end)
+        
+        # 获取范围内的文本，一次扫描得到所有标记
+        content = self.editor.get(seg_start, f"{last}.end")
+        line_starts = line_start_offsets(content)
+        ranges = {}
+        for tag, start, end in tokenize_markdown(content):
+            ranges.setdefault(tag, []).extend((
+                offset_to_index(line_starts, start, first),
+                offset_to_index(line_starts, end, first),
+            ))
+        
+        # 每个标签只调用一次 tag_add，一次传入所有范围
+        for tag, indices in ranges.items():
+            self.editor.tag_add(tag, *indices)
+    
+    def apply_theme_styles(self, theme_name):
+        """按主题的样式表设置编辑器颜色和语法标签样式
+        
+        标签的样式与标签范围无关，只需在主题变化时设置一次，不必重新高亮。
+        """
+        if theme_name == self._styled_theme:
+            return
+        styles = self.THEME_STYLES.get(theme_name, self.LIGHT_STYLES)
+        for tab in self._tabs:
+            if tab["editor"] is not None:
+                self.style_editor(tab["editor"], styles)
+        self._styled_theme = theme_name
+    
+    def style_editor(self, editor, styles):
+        """把样式表应用到一个编辑器"""
+        editor.config(**styles["editor"])
+        for tag, options in styles["tags"].items():
+            editor.tag_config(tag, **options)
     
     def select_all(self):
         """全选文本"""
         self.editor.tag_add("sel", "1.0", "end")
         return "break"  # 阻止默认事件
     
-    def on_content_change(self, event=None):
-        """内容变化时更新预览和状态"""
+    def on_content_change(self):
+        """内容变化时按优先级调度更新任务，新的修改会取消尚未执行的旧任务"""
         if self.auto_preview_enabled:
-            # 取消之前的定时器（如果有）
-            if self.after_id is not None:
-                self.root.after_cancel(self.after_id)
-            
-            # 设置新的定时器
-            self.after_id = self.root.after(150, self.update_preview_and_status)
+            self._scheduler.schedule("highlight")
+            self._scheduler.schedule("status")
+            self._scheduler.schedule("preview")
+            if self._outline is not None:
+                self._scheduler.schedule("outline")
     
     def update_preview_and_status(self):
-        """更新预览和状态栏"""
-        content = self.editor.get("1.0", tk.END)
+        """立即更新高亮、状态栏、预览和大纲"""
+        self._scheduler.cancel()
+        self.update_highlight()
+        self.update_status()
+        self.update_preview()
+        self.update_outline()
+    
+    def update_highlight(self):
+        """更新修改过的行（通常就是当前行）的语法高亮"""
+        if self._load_file is not None:
+            # 文件还在读取中，读取完成后会统一更新
+            return
+        self.highlight_syntax()
+    
+    def update_status(self):
+        """更新字数统计、修改标记和标题"""
+        if self._load_file is not None:
+            return
+        self.update_text_counts()
+        self.update_status_counts()
+        self.is_modified = self._change_count != self._saved_change_count
+        self.update_title()
+    
+    def update_preview(self):
+        """在后台渲染预览，并刷新查找结果"""
+        if self._load_file is not None or self._change_count == self._updated_change_count:
+            return
+        self._updated_change_count = self._change_count
         
-        # 移除末尾的换行符（tk.Text 自动添加的）
-        if content.endswith('\n'):
-            content = content[:-1]
+        # 渲染需要完整的文本，高亮和统计只处理修改过的行
+        self.request_preview(self.editor.get("1.0", "end-1c"))
         
-        if content != self.last_content:
-            # 更新预览
-            html_content = self.render_markdown(content)
-            self.preview.set_html(html_content)
-            
-            # 更新状态栏
-            char_count = len(content)
-            word_count = len(re.findall(r'\b\w+\b', content)) if content else 0
-            self.status_label.config(text=f"就绪 | 字符数: {char_count} | 单词数: {word_count}")
-            
-            # 更新语法高亮
-            self.highlight_syntax()
-            self.apply_syntax_highlighting_colors()
-            
-            self.last_content = content
-            self.is_modified = True
-            self.update_title()
+        # 内容变化后刷新查找结果
+        if self._search is not None:
+            self.update_search()
+    
+    @timed("word_count", lambda self: len(self._line_words))
+    def update_text_counts(self):
+        """只重新统计修改过的行，更新全文的单词数和字符数"""
+        if self._line_words is None:
+            # 第一次统计整个文档
+            self._line_words, self._line_chars = [], []
+            self._word_count = self._char_count = 0
+            line_count = int(self.editor.index("end-1c").split(".")[0])
+            first, last, delta = 0, line_count, line_count
+        elif self._count_dirty_lines is None:
+            return
+        else:
+            first, last, delta = self._count_dirty_lines
+        self._count_dirty_lines = None
+        
+        lines = self.editor.get(f"{first + 1}.0", f"{last}.end").split("\n")
+        findall = self.WORD_PATTERN.findall
+        words = [len(findall(line)) for line in lines]
+        chars = [len(line) for line in lines]
+        
+        old_last = last - delta
+        self._word_count += sum(words) - sum(self._line_words[first:old_last])
+        self._char_count += sum(chars) - sum(self._line_chars[first:old_last])
+        self._line_words[first:old_last] = words
+        self._line_chars[first:old_last] = chars
+    
+    def update_status_counts(self):
+        """在状态栏显示字数、阅读时间和选中文本的字数"""
+        if self._line_words is None:
+            return
+        # 字符数包括行之间的换行符
+        char_count = self._char_count + len(self._line_chars) - 1
+        minutes = -(-self._word_count // self.WORDS_PER_MINUTE)
+        text = f"就绪 | 字符数: {char_count} | 单词数: {self._word_count} | 阅读时间: 约 {minutes} 分钟"
         
-        # 清除定时器ID
-        self.after_id = None
+        if self.editor.tag_ranges(tk.SEL):
+            # 只统计选中的文本
+            selected = self.editor.get(tk.SEL_FIRST, tk.SEL_LAST)
+            text += f" | 选中: {len(selected)} 字符, {len(self.WORD_PATTERN.findall(selected))} 单词"
+        self.status_label.config(text=text)
     
     def render_markdown(self, markdown_text):
         """将markdown渲染为HTML"""
+        return "\n".join(html for _, html, _ in self.render_markdown_blocks(markdown_text))
+    
+    @timed("render_markdown", lambda self, markdown_text: len(markdown_text))
+    def render_markdown_blocks(self, markdown_text):
+        """将markdown按顶层块渲染，返回 (内容哈希, HTML, 块的起始行号) 列表"""
         try:
             if not markdown_text:
-                return self.PREVIEW_DEFAULT_HTML
-            
-            # 转换为HTML
-            html = markdown.markdown(
-                markdown_text,
-                extensions=[
-                    'markdown.extensions.extra',
-                    'markdown.extensions.codehilite',
-                    'markdown.extensions.tables',
-                    'markdown.extensions.fenced_code',
-                    'markdown.extensions.nl2br'
-                ]
-            )
-            return html
+                return [(content_key(self.PREVIEW_DEFAULT_HTML), self.PREVIEW_DEFAULT_HTML, 0)]
+            return self._renderer.render_blocks(markdown_text)
         except Exception as e:
             # 出现错误时返回错误信息
-            return f"<h1>Markdown 解析错误</h1><p>{str(e)}</p><pre>{markdown_text}</pre>"
+            html = f"<h1>Markdown 解析错误</h1><p>{str(e)}</p><pre>{markdown_text}</pre>"
+            return [(content_key(html), html, 0)]
+    
+    def start_render_worker(self):
+        """启动后台渲染线程"""
+        if self._render_thread is None:
+            self._render_thread = threading.Thread(target=self.render_worker, daemon=True)
+            self._render_thread.start()
+    
+    def request_preview(self, content):
+        """在后台线程中渲染预览，只保留最新一次的渲染请求"""
+        with self._render_condition:
+            self._render_generation += 1
+            self._render_request = (self._render_generation, content)
+            self._render_condition.notify()
+        
+        self.start_render_worker()
+        if self._render_poll_id is None:
+            self._render_poll_id = self.root.after(self.RENDER_POLL_INTERVAL, self.poll_preview)
+    
+    def cancel_preview(self):
+        """丢弃尚未完成的预览渲染"""
+        with self._render_condition:
+            self._render_generation += 1
+            self._render_request = None
+            self._render_result = None
+            self._render_done = self._render_generation
+    
+    def render_worker(self):
+        """后台渲染线程：不断取出最新的请求进行渲染"""
+        # 载入上次保存的代码块高亮缓存，并提前创建转换器，第一次预览时不必再等待扩展加载
+        if self._highlight_cache_path:
+            HIGHLIGHT_CACHE.load(self._highlight_cache_path)
+        self._renderer.get_converter()
+        
+        while True:
+            with self._render_condition:
+                while self._render_request is None:
+                    self._render_condition.wait()
+                generation, content = self._render_request
+                self._render_request = None
+            
+            start = time.perf_counter()
+            blocks = self.render_markdown_blocks(content)
+            cost = (time.perf_counter() - start) * 1000
+            
+            with self._render_condition:
+                # 渲染期间有更新的请求时丢弃这次结果
+                if generation == self._render_generation:
+                    self._render_result = blocks
+                    self._render_cost = cost
+                    self._render_done = generation
+    
+    def poll_preview(self):
+        """在主线程中取回渲染结果并更新预览"""
+        with self._render_condition:
+            blocks = self._render_result
+            self._render_result = None
+            cost = self._render_cost
+            waiting = self._render_done != self._render_generation
+        
+        if blocks is not None:
+            # 预览更新的间隔随渲染和写入预览的耗时调整
+            start = time.perf_counter()
+            self.create_preview()
+            self.patch_preview(blocks)
+            self._rendered_blocks = blocks
+            self._scheduler.report_cost("preview", cost + (time.perf_counter() - start) * 1000)
+        
+        if waiting:
+            self._render_poll_id = self.root.after(self.RENDER_POLL_INTERVAL, self.poll_preview)
+        else:
+            self._render_poll_id = None
+    
+    @timed("set_html", lambda self, blocks: len(blocks))
+    def patch_preview(self, blocks):
+        """把新的块列表与当前预览对比，只删除和插入发生变化的块，并保持滚动位置"""
+        preview = self.preview
+        old_blocks = self._preview_blocks
+        scroll_top = preview.yview()[0]
+        preview.config(state=tk.NORMAL)
+        
+        if old_blocks is None:
+            # 预览内容不是按块写入的，先全部清空
+            preview.delete("1.0", tk.END)
+            for tag in preview.tag_names():
+                preview.tag_delete(tag)
+            old_blocks = []
+        
+        # 跳过相同的前缀和后缀
+        start = 0
+        limit = min(len(old_blocks), len(blocks))
+        while start < limit and old_blocks[start]["key"] == blocks[start][0]:
+            start += 1
+        old_end, new_end = len(old_blocks), len(blocks)
+        while old_end > start and new_end > start and old_blocks[old_end - 1]["key"] == blocks[new_end - 1][0]:
+            old_end -= 1
+            new_end -= 1
+        
+        # 插入位置：第一个保留的后缀块的开头，没有后缀时为末尾
+        anchor = old_blocks[old_end]["mark"] if old_end < len(old_blocks) else "end-1c"
+        
+        # 删除变化的旧块
+        if start < old_end:
+            preview.delete(old_blocks[start]["mark"], anchor)
+            for record in old_blocks[start:old_end]:
+                if record["tags"]:
+                    preview.tag_delete(*record["tags"])
+                preview.mark_unset(record["mark"])
+        
+        # 依次插入新的块
+        inserted = [self.insert_preview_block(key, html, anchor) for key, html, _ in blocks[start:new_end]]
+        
+        self._preview_blocks = old_blocks[:start] + inserted + old_blocks[old_end:]
+        self._preview_block_lines = [line for _, _, line in blocks]
+        preview.config(state=tk.DISABLED)
+        preview.yview_moveto(scroll_top)
+    
+    def insert_preview_block(self, key, html, anchor):
+        """在 anchor 之前写入一个块的内容，返回该块的记录"""
+        preview = self.preview
+        index = preview.index(anchor)
+        self._preview_block_id += 1
+        mark = f"preview_block{self._preview_block_id}"
+        
+        # 写入期间块的起始标记保持在左侧，写完后随前面插入的内容右移
+        preview.mark_set(mark, index)
+        preview.mark_gravity(mark, tk.LEFT)
+        preview.mark_set("preview_end", index)
+        
+        region = PreviewRegion(preview, f"{mark}:", mark, "preview_end")
+        parser = preview.html_parser
+        parser.w_set_html(region, html, strip=True)
+        
+        # 块之间空一行
+        preview.insert("preview_end", "\n\n", ())
+        preview.mark_gravity(mark, tk.RIGHT)
+        
+        # 保留图片的引用，否则图片会被回收
+        return {"key": key, "mark": mark, "tags": region.tags, "images": parser.images}
+    
+    def reset_preview(self, html):
+        """直接设置整个预览的HTML"""
+        self.create_preview()
+        self.preview.set_html(html)
+        self._preview_blocks = None
+        self._rendered_blocks = None
     
     def new_file(self):
-        """新建文件"""
-        if self.is_modified:
-            if not self.ask_save_changes():
-                return
-        
-        # 取消待处理的定时器
-        if self.after_id is not None:
-            self.root.after_cancel(self.after_id)
-            self.after_id = None
-        
-        self.editor.delete("1.0", tk.END)
-        self.preview.set_html(self.PREVIEW_DEFAULT_HTML)
-        self.current_file = None
-        self.is_modified = False
-        self.last_content = ""
-        self.update_title()
-        self.status_label.config(text="就绪 | 字符数: 0 | 单词数: 0")
+        """新建文件（在新的标签页中）"""
+        self.create_tab()
         return "break"
     
     def open_file(self):
-        """打开文件"""
-        if self.is_modified:
-            if not self.ask_save_changes():
-                return
-        
+        """打开文件：已经打开的文件切换到它的标签页，否则在新的标签页中打开"""
         file_path = filedialog.askopenfilename(
             filetypes=[
                 ("Markdown文件", "*.md *.markdown"),
@@ -447,55 +1849,208 @@ class MarkdownEditor:
         )
         
         if file_path:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    content = file.read()
-                
-                # 取消待处理的定时器
-                if self.after_id is not None:
-                    self.root.after_cancel(self.after_id)
-                    self.after_id = None
-                
-                self.editor.delete("1.0", tk.END)
-                self.editor.insert("1.0", content)
-                self.current_file = file_path
-                self.is_modified = False
-                self.last_content = content
-                self.update_preview_and_status()  # 立即更新预览
-                self.update_title()
-                self.status_label.config(text=f"已打开: {os.path.basename(file_path)}")
-            except Exception as e:
-                messagebox.showerror("错误", f"无法打开文件: {str(e)}")
+            for tab in self._tabs:
+                path = self.current_file if tab is self._active_tab else tab["state"]["current_file"]
+                if path and os.path.abspath(path) == os.path.abspath(file_path):
+                    self.activate_tab(tab)
+                    return "break"
+            
+            # 当前标签页是没有动过的空白文档时直接使用它
+            if self.current_file is not None or self._change_count:
+                self.create_tab()
+            self.start_loading(file_path)
         
         return "break"
     
-    def save_file(self):
-        """保存文件"""
-        if not self.current_file:
-            self.save_file_as()
+    def start_loading(self, file_path):
+        """开始分块读取文件，读取期间界面保持响应"""
+        self.stop_loading()
+        try:
+            file = open(file_path, 'r', encoding='utf-8')
+            size = os.fstat(file.fileno()).st_size
+        except Exception as e:
+            messagebox.showerror("错误", f"无法打开文件: {str(e)}")
             return
         
+        # 取消待处理的更新任务
+        self._scheduler.cancel()
+        
+        self._load_file = file
+        self._load_path = file_path
+        self._load_size = size
+        
+        # 读取期间禁止编辑，也不记录撤销操作
+        self.cancel_preview()
+        self.editor.config(state=tk.NORMAL, undo=False)
+        self.editor.delete("1.0", tk.END)
+        self.editor.config(state=tk.DISABLED)
+        self.discard_journal()
+        self.current_file = file_path
+        self.is_modified = False
+        self.update_title()
+        self.load_next_chunk()
+    
+    def load_next_chunk(self):
+        """读取并插入下一块内容，全部读完后再更新预览和语法高亮"""
+        self._load_after_id = None
         try:
-            content = self.editor.get("1.0", tk.END)
-            
-            # 移除tk.Text自动添加的最后一个换行符
-            if content.endswith('\n'):
-                content = content[:-1]
-                
-            with open(self.current_file, 'w', encoding='utf-8') as file:
-                file.write(content)
-            
-            self.is_modified = False
-            self.last_content = content
-            self.status_label.config(text=f"已保存: {os.path.basename(self.current_file)}")
-            self.update_title()
+            chunk = self._load_file.read(self.LOAD_CHUNK_SIZE)
         except Exception as e:
-            messagebox.showerror("错误", f"无法保存文件: {str(e)}")
+            self.cancel_loading()
+            messagebox.showerror("错误", f"无法打开文件: {str(e)}")
+            return
+        
+        if chunk:
+            self.editor.config(state=tk.NORMAL)
+            self.editor.insert("end-1c", chunk)
+            self.editor.config(state=tk.DISABLED)
+            
+            progress = self._load_file.buffer.tell() * 100 // self._load_size if self._load_size else 100
+            self.status_label.config(
+                text=f"正在打开: {os.path.basename(self._load_path)} {min(progress, 100)}% (按 Esc 取消)")
+            self._load_after_id = self.root.after(1, self.load_next_chunk)
+            return
+        
+        file_path = self._load_path
+        self.stop_loading()
+        self._scheduler.cancel()
+        self.editor.mark_set(tk.INSERT, "1.0")
+        self.editor.see("1.0")
+        
+        # 读取完成后一次性更新预览和语法高亮
+        content = self.editor.get("1.0", "end-1c")
+        self.request_preview(content)
+        self.highlight_syntax(full=True)
+        self.update_outline()
+        self._updated_change_count = self._saved_change_count = self._change_count
+        self.status_label.config(text=f"已打开: {os.path.basename(file_path)}")
+    
+    def stop_loading(self):
+        """停止读取文件并恢复编辑器"""
+        if self._load_file is None:
+            return
+        if self._load_after_id is not None:
+            self.root.after_cancel(self._load_after_id)
+            self._load_after_id = None
+        self._load_file.close()
+        self._load_file = None
+        self._load_path = None
+        self.editor.config(state=tk.NORMAL, undo=True)
+        self.editor.edit_reset()
+    
+    def cancel_loading(self):
+        """取消正在打开的文件，清空已经读入的内容"""
+        if self._load_file is None:
+            return
+        file_name = os.path.basename(self._load_path)
+        self.stop_loading()
+        self.editor.delete("1.0", tk.END)
+        self.discard_journal()
+        self.reset_preview(self.PREVIEW_DEFAULT_HTML)
+        self.current_file = None
+        self.is_modified = False
+        self._updated_change_count = self._saved_change_count = self._change_count
+        self.update_title()
+        self.status_label.config(text=f"已取消打开: {file_name}")
+    
+    def save_file(self, wait=False):
+        """保存文件：在后台线程中写入，wait 为 True 时等待写入完成
+        
+        返回 None 表示没有保存成功。
+        """
+        if self.refuse_save_while_loading():
+            return None
+        if not self.current_file:
+            return self.save_file_as(wait)
+        
+        content = self.editor.get("1.0", tk.END)
+        
+        # 移除tk.Text自动添加的最后一个换行符
+        if content.endswith('\n'):
+            content = content[:-1]
+        
+        with self._save_condition:
+            # 尚未开始的写入直接被这次请求取代
+            self._save_generation += 1
+            self._save_request = (self._save_generation, self.current_file, content, self._change_count)
+            self._save_condition.notify()
+        
+        if self._save_thread is None:
+            self._save_thread = threading.Thread(target=self.save_worker, daemon=True)
+            self._save_thread.start()
+        
+        self.status_label.config(text=f"正在保存: {os.path.basename(self.current_file)}")
         
+        if wait:
+            self.wait_for_save()
+            return None if self.is_modified else "break"
+        
+        if self._save_poll_id is None:
+            self._save_poll_id = self.root.after(self.RENDER_POLL_INTERVAL, self.poll_save)
         return "break"
     
-    def save_file_as(self):
+    def save_worker(self):
+        """后台保存线程：每次取出最新的请求写入磁盘"""
+        while True:
+            with self._save_condition:
+                while self._save_request is None:
+                    self._save_condition.wait()
+                generation, path, content, change_count = self._save_request
+                self._save_request = None
+            
+            try:
+                write_file_atomic(path, content)
+                error = None
+            except Exception as e:
+                error = e
+            
+            with self._save_condition:
+                self._save_result = (path, change_count, error)
+                self._save_done = generation
+                self._save_condition.notify_all()
+    
+    def poll_save(self):
+        """在主线程中处理保存结果，写入落盘后才清除修改标记"""
+        with self._save_condition:
+            result = self._save_result
+            self._save_result = None
+            waiting = self._save_done != self._save_generation
+        
+        if result is not None:
+            path, change_count, error = result
+            if error is not None:
+                messagebox.showerror("错误", f"无法保存文件: {str(error)}")
+            elif path == self.current_file:
+                # 磁盘上的文件已经更新，旧日志不再适用
+                self.discard_journal()
+                self._saved_change_count = change_count
+                if change_count == self._change_count:
+                    # 保存之后没有再修改过
+                    self.is_modified = False
+                    self.status_label.config(text=f"已保存: {os.path.basename(path)}")
+                    self.update_title()
+                else:
+                    self.compact_journal()
+        
+        if waiting:
+            self._save_poll_id = self.root.after(self.RENDER_POLL_INTERVAL, self.poll_save)
+        else:
+            self._save_poll_id = None
+    
+    def wait_for_save(self):
+        """阻塞直到所有保存请求都已写入"""
+        with self._save_condition:
+            while self._save_done != self._save_generation:
+                self._save_condition.wait()
+        
+        if self._save_poll_id is not None:
+            self.root.after_cancel(self._save_poll_id)
+        self.poll_save()
+    
+    def save_file_as(self, wait=False):
         """另存为"""
+        if self.refuse_save_while_loading():
+            return None
         file_path = filedialog.asksaveasfilename(
             defaultextension=".md",
             filetypes=[
@@ -508,8 +2063,19 @@ class MarkdownEditor:
         
         if file_path:
             self.current_file = file_path
-            self.save_file()
             self.update_title()
+            return self.save_file(wait)
+    
+    def refuse_save_while_loading(self):
+        """文件还在分块读取时拒绝保存，返回 True 表示拒绝
+        
+        打开文件时 current_file 已经指向该文件，编辑器中却只有读到的部分，
+        此时保存（Ctrl+S、工具栏和菜单在读取期间都可用）会用这部分内容覆盖磁盘上的文件。
+        """
+        if self._load_file is None:
+            return False
+        messagebox.showwarning("保存", "文件正在打开，读取完成后才能保存（按 Esc 取消打开）")
+        return True
     
     def ask_save_changes(self):
         """询问是否保存更改"""
@@ -524,43 +2090,51 @@ class MarkdownEditor:
         if response is None:  # 取消
             return False
         elif response:  # 是
-            return self.save_file() is not None
+            return self.save_file(wait=True) is not None
         else:  # 否
             return True
     
     
     def change_theme_directly(self, theme_name):
-        """直接切换主题"""
-        # 切换主题
+        """直接切换主题：只更新样式，不重新渲染预览，也不重新高亮"""
+        if theme_name == self.root.style.theme.name:
+            return
+        
+        # 切换主题（ttkbootstrap 同时更新预览组件的背景色）
+        old_background = self.preview.cget("background") if self.preview is not None else None
         self.root.style.theme_use(theme_name)
         self.theme_label.config(text=f"主题: {theme_name}")
         
-        # 更新预览
-        content = self.editor.get("1.0", tk.END)
-        if content.endswith('\n'):
-            content = content[:-1]
-        html_content = self.render_markdown(content)
-        self.preview.set_html(html_content)
-        
-        # 根据主题更新编辑器颜色和语法高亮颜色
-        if theme_name in self.DARK_THEMES:
-            self.editor.config(bg="#2d2d2d", fg="#ffffff", insertbackground="white")
-        else:
-            self.editor.config(bg="#ffffff", fg="#000000", insertbackground="black")
-        
-        # 应用语法高亮颜色
-        self.apply_syntax_highlighting_colors()
+        # 根据主题的样式表更新编辑器颜色和语法高亮颜色
+        self.apply_theme_styles(theme_name)
+        if self.preview is not None:
+            self.restyle_preview(old_background)
+    
+    def restyle_preview(self, old_background):
+        """tkhtmlview 把写入时组件的背景色写进了每个标签，把这些标签改为组件新的背景色
         
-        # 重新应用语法高亮
-        self.highlight_syntax()
+        其他背景色（例如 <mark> 的高亮）保持不变，不需要重新解析 HTML。
+        """
+        preview = self.preview
+        old_background = str(old_background)
+        background = str(preview.cget("background"))
+        if background == old_background:
+            return
+        for tag in preview.tag_names():
+            if str(preview.tag_cget(tag, "background")) == old_background:
+                preview.tag_configure(tag, background=background)
     
     def find_text(self):
-        """查找文本"""
+        """查找文本：输入时即时查找，不弹出对话框"""
+        if self._search is not None:
+            self._search["window"].lift()
+            self._search["entry"].focus_set()
+            return
+        
         search_window = tk.Toplevel(self.root)
-        search_window.title("查找")
-        search_window.geometry("350x120")
+        search_window.title("查找和替换")
+        search_window.geometry("380x200")
         search_window.transient(self.root)
-        search_window.grab_set()
         
         ttk.Label(search_window, text="查找内容:").pack(pady=(10, 0))
         
@@ -569,72 +2143,439 @@ class MarkdownEditor:
         search_entry.pack(padx=10, pady=5, fill=tk.X)
         search_entry.focus_set()
         
-        def do_search():
-            search_text = search_var.get()
-            if not search_text:
-                messagebox.showwarning("查找", "请输入要查找的内容")
-                return
-            
-            # 移除之前的标记
-            self.editor.tag_remove('search', '1.0', tk.END)
-            
-            # 搜索并标记
-            start_pos = '1.0'
-            found_count = 0
-            while True:
-                pos = self.editor.search(search_text, start_pos, stopindex=tk.END, nocase=True)
-                if not pos:
-                    break
-                
-                end_pos = f"{pos}+{len(search_text)}c"
-                self.editor.tag_add('search', pos, end_pos)
-                start_pos = end_pos
-                found_count += 1
-            
-            # 配置搜索标记样式
-            self.editor.tag_config('search', background='yellow', foreground='black')
-            
-            if found_count > 0:
-                # 滚动到第一个匹配项
-                self.editor.see('1.0')
-                messagebox.showinfo("查找结果", f"找到 {found_count} 处匹配")
-            else:
-                messagebox.showinfo("查找结果", "未找到匹配项")
+        ttk.Label(search_window, text="替换为:").pack()
+        
+        replace_var = tk.StringVar()
+        replace_entry = ttk.Entry(search_window, textvariable=replace_var, width=30)
+        replace_entry.pack(padx=10, pady=5, fill=tk.X)
         
-        def close_search():
-            # 清除搜索标记
-            self.editor.tag_remove('search', '1.0', tk.END)
-            search_window.destroy()
+        option_frame = ttk.Frame(search_window)
+        option_frame.pack(padx=10, fill=tk.X)
+        
+        regex_var = tk.BooleanVar(value=False)
+        case_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(option_frame, text="正则表达式", variable=regex_var,
+                        command=self.schedule_search).pack(side=tk.LEFT)
+        ttk.Checkbutton(option_frame, text="区分大小写", variable=case_var,
+                        command=self.schedule_search).pack(side=tk.LEFT, padx=10)
+        count_label = ttk.Label(option_frame, text="")
+        count_label.pack(side=tk.RIGHT)
         
         button_frame = ttk.Frame(search_window)
         button_frame.pack(pady=5)
         
-        ttk.Button(button_frame, text="查找", command=do_search).pack(side=tk.LEFT, padx=5)
-        ttk.Button(button_frame, text="关闭", command=close_search).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="上一个", command=lambda: self.show_search_match(-1)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="下一个", command=lambda: self.show_search_match(1)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="替换", command=self.replace_current_match).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="全部替换", command=self.replace_all_matches).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="关闭", command=self.close_search).pack(side=tk.LEFT, padx=5)
+        
+        self._search = {
+            "window": search_window,
+            "entry": search_entry,
+            "replace_entry": replace_entry,
+            "query_var": search_var,
+            "replace_var": replace_var,
+            "regex_var": regex_var,
+            "case_var": case_var,
+            "count_label": count_label,
+            "after_id": None,
+            "options": None,  # 上次查找的 (查询, 正则, 区分大小写)
+            "change_count": None,  # 上次查找时编辑器内容的修改次数
+            "content": "",
+            "line_starts": [0],
+            "matches": [],
+            "current": -1,  # 当前匹配的序号
+        }
+        
+        # 配置搜索标记样式，显示在语法高亮之上
+        self.editor.tag_config('search', background='yellow', foreground='black')
+        self.editor.tag_config('search_current', background='orange', foreground='black')
+        
+        search_var.trace_add("write", lambda *args: self.schedule_search())
+        search_entry.bind("<Return>", lambda e: self.show_search_match(1))
+        search_entry.bind("<Shift-Return>", lambda e: self.show_search_match(-1))
+        search_entry.bind("<Escape>", lambda e: self.close_search())
+        replace_entry.bind("<Return>", lambda e: self.replace_current_match())
+        replace_entry.bind("<Escape>", lambda e: self.close_search())
+        search_window.protocol("WM_DELETE_WINDOW", self.close_search)
+    
+    def replace_text(self):
+        """打开查找和替换窗口，并把焦点放在替换输入框"""
+        self.find_text()
+        self._search["replace_entry"].focus_set()
+        return "break"
+    
+    def replace_current_match(self):
+        """替换当前匹配，然后跳到下一个匹配"""
+        search = self._search
+        if search["after_id"] is not None or search["change_count"] != self._change_count:
+            self.update_search()
+        if search["current"] < 0:
+            # 还没有选中匹配时先跳到光标之后的匹配
+            self.show_search_match(1)
+            return "break"
+        
+        query, regex, case_sensitive = search["options"]
+        start, end = search["matches"][search["current"]]
+        replacement = search["replace_var"].get()
+        try:
+            if regex:
+                # 在完整文本上重新匹配，保证前后文相关的模式和分组引用正确
+                pattern = re.compile(query, 0 if case_sensitive else re.IGNORECASE)
+                replacement = pattern.match(search["content"], start).expand(replacement)
+        except re.error as e:
+            search["count_label"].config(text=f"替换内容错误: {e.msg}")
+            return "break"
+        
+        line_starts = search["line_starts"]
+        self.replace_editor_range(offset_to_index(line_starts, start), offset_to_index(line_starts, end), replacement)
+        self.editor.mark_set(tk.INSERT, f"{offset_to_index(line_starts, start)}+{len(replacement)}c")
+        self.refresh_after_replace()
+        self.show_search_match(1)
+        return "break"
+    
+    def replace_all_matches(self):
+        """在 Python 端一次算出替换后的文本，作为一次编辑写回编辑器"""
+        search = self._search
+        if search["after_id"] is not None or search["change_count"] != self._change_count:
+            self.update_search()
+        matches = search["matches"]
+        if not matches:
+            return
         
-        search_entry.bind("<Return>", lambda e: do_search())
-        search_window.protocol("WM_DELETE_WINDOW", close_search)
+        query, regex, case_sensitive = search["options"]
+        content = search["content"]
+        try:
+            replaced, count = replace_matches(content, query, search["replace_var"].get(), regex, case_sensitive)
+        except re.error as e:
+            search["count_label"].config(text=f"替换内容错误: {e.msg}")
+            return
+        
+        # 只改写第一个匹配到最后一个匹配之间的文本，前后的内容没有变化
+        first, last = matches[0][0], matches[-1][1]
+        replaced = replaced[first:len(replaced) - (len(content) - last)]
+        line_starts = search["line_starts"]
+        self.replace_editor_range(offset_to_index(line_starts, first), offset_to_index(line_starts, last), replaced)
+        self.refresh_after_replace()
+        search["count_label"].config(text=f"已替换 {count} 处")
+    
+    def replace_editor_range(self, start, end, text):
+        """用一次 replace 改写编辑器中的一段文本，撤销时作为一个整体"""
+        top = self.editor.yview()[0]
+        self.editor.config(autoseparators=False)
+        try:
+            self.editor.edit_separator()
+            self.editor.replace(start, end, text)
+            self.editor.edit_separator()
+        finally:
+            self.editor.config(autoseparators=True)
+        self.editor.yview_moveto(top)
+    
+    def refresh_after_replace(self):
+        """替换后立即刷新一次预览、高亮和查找结果，不再等待定时器"""
+        self.update_preview_and_status()
+    
+    def schedule_search(self):
+        """输入停顿后再查找，连续输入时只查找最后一次"""
+        search = self._search
+        if search["after_id"] is not None:
+            self.root.after_cancel(search["after_id"])
+        search["after_id"] = self.root.after(self.SEARCH_DELAY, self.update_search)
+    
+    def update_search(self):
+        """在 Python 端的文本上查找并批量更新高亮"""
+        search = self._search
+        search["after_id"] = None
+        options = (search["query_var"].get(), search["regex_var"].get(), search["case_var"].get())
+        query, regex, case_sensitive = options
+        
+        # 内容没有变化时复用上次的文本
+        if search["change_count"] != self._change_count:
+            search["content"] = self.editor.get("1.0", "end-1c")
+            search["line_starts"] = line_start_offsets(search["content"])
+            search["change_count"] = self._change_count
+            candidates = None
+        else:
+            # 普通文本查询变长时，新的匹配一定在旧的匹配位置上；
+            # 旧查询的前缀和后缀相同时匹配可能重叠，旧结果不完整，需要重新查找
+            previous = search["options"]
+            candidates = None
+            if (previous is not None and not regex and previous[1:] == options[1:]
+                    and previous[0] and query.startswith(previous[0])):
+                prefix = previous[0] if case_sensitive else previous[0].lower()
+                if not any(prefix[:k] == prefix[-k:] for k in range(1, len(prefix))):
+                    candidates = search["matches"]
+        
+        try:
+            matches = find_matches(search["content"], query, regex, case_sensitive, candidates)
+        except re.error as e:
+            search["count_label"].config(text=f"正则表达式错误: {e.msg}")
+            matches = []
+        else:
+            search["count_label"].config(text=f"{len(matches)} 个匹配" if query else "")
+        
+        search["options"] = options
+        search["matches"] = matches
+        search["current"] = -1
+        
+        # 移除之前的标记，再分批标记所有匹配
+        self.editor.tag_remove('search', '1.0', tk.END)
+        self.editor.tag_remove('search_current', '1.0', tk.END)
+        line_starts = search["line_starts"]
+        for batch in range(0, len(matches), self.SEARCH_TAG_BATCH):
+            indices = []
+            for start, end in matches[batch:batch + self.SEARCH_TAG_BATCH]:
+                indices.append(offset_to_index(line_starts, start))
+                indices.append(offset_to_index(line_starts, end))
+            self.editor.tag_add('search', *indices)
+        self.editor.tag_raise('search')
+        self.editor.tag_raise('search_current')
+    
+    def show_search_match(self, step):
+        """跳到光标之后（step 为 1）或之前（step 为 -1）的匹配"""
+        search = self._search
+        if search["after_id"] is not None or search["change_count"] != self._change_count:
+            # 还有未执行的查找，或者内容在上次查找后变化过（预览任务还没有刷新结果）时先重新查找
+            if search["after_id"] is not None:
+                self.root.after_cancel(search["after_id"])
+            self.update_search()
+        
+        matches = search["matches"]
+        if not matches:
+            return "break"
+        
+        if search["current"] >= 0:
+            current = (search["current"] + step) % len(matches)
+        else:
+            # 从光标位置开始查找
+            line, column = self.editor.index(tk.INSERT).split(".")
+            offset = search["line_starts"][int(line) - 1] + int(column)
+            position = bisect.bisect_left(matches, (offset, offset))
+            current = position % len(matches) if step > 0 else (position - 1) % len(matches)
+        search["current"] = current
+        
+        start, end = matches[current]
+        start_index = offset_to_index(search["line_starts"], start)
+        end_index = offset_to_index(search["line_starts"], end)
+        self.editor.tag_remove('search_current', '1.0', tk.END)
+        self.editor.tag_add('search_current', start_index, end_index)
+        self.editor.mark_set(tk.INSERT, end_index if step > 0 else start_index)
+        self.editor.see(start_index)
+        search["count_label"].config(text=f"第 {current + 1} / {len(matches)} 个")
+        return "break"
+    
+    def close_search(self):
+        """关闭查找窗口并清除搜索标记"""
+        search = self._search
+        if search is None:
+            return
+        if search["after_id"] is not None:
+            self.root.after_cancel(search["after_id"])
+        self.editor.tag_remove('search', '1.0', tk.END)
+        self.editor.tag_remove('search_current', '1.0', tk.END)
+        search["window"].destroy()
+        self._search = None
+    
+    def update_heading_index(self):
+        """只重新扫描修改过的行，更新按行号排序的标题索引"""
+        if self._outline_dirty_lines is None:
+            return
+        first, last, delta = self._outline_dirty_lines
+        self._outline_dirty_lines = None
+        
+        # 替换修改前的行 [first, last - delta) 中的标题，之后的标题行号整体移动
+        headings = find_headings(self.editor.get(f"{first + 1}.0", f"{last}.end"), first)
+        low = bisect.bisect_left(self._heading_lines, first)
+        high = bisect.bisect_left(self._heading_lines, last - delta)
+        self._heading_lines[low:high] = [line for line, _, _ in headings]
+        self._headings[low:high] = [(level, title) for _, level, title in headings]
+        if delta:
+            lines = self._heading_lines
+            for i in range(low + len(headings), len(lines)):
+                lines[i] += delta
+    
+    def toggle_outline(self):
+        """显示或隐藏编辑器左侧的大纲面板"""
+        if self._outline is not None:
+            self._scheduler.cancel("outline")
+            self._paned_window.forget(self._outline["frame"])
+            self._outline["frame"].destroy()
+            self._outline = None
+            return "break"
+        
+        frame = ttk.LabelFrame(self._paned_window, text="大纲", padding=5)
+        scrollbar = ttk.Scrollbar(frame)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        listbox = tk.Listbox(frame, activestyle=tk.NONE, exportselection=False, width=28,
+                             yscrollcommand=scrollbar.set)
+        listbox.pack(fill=tk.BOTH, expand=True)
+        scrollbar.config(command=listbox.yview)
+        listbox.bind("<<ListboxSelect>>", lambda e: self.jump_to_heading())
+        self._paned_window.insert(0, frame, weight=0)
+        
+        self._outline = {
+            "frame": frame,
+            "listbox": listbox,
+            "labels": [],  # 列表中显示的文字
+            "lines": [],  # 与列表各项对应的标题行号
+        }
+        self.update_outline()
+        return "break"
+    
+    def update_outline(self):
+        """更新标题索引，并在标题变化时刷新大纲列表（面板没有打开时不做任何事）"""
+        outline = self._outline
+        if outline is None or self._load_file is not None:
+            return
+        self.update_heading_index()
+        
+        # 代码块内以 # 开头的行不是标题；与高亮使用相同的围栏配对规则，未闭合的围栏之后仍是普通文本
+        in_code_block = self.find_fence_block if self._fence_lines is not None else lambda line: None
+        lines, labels = [], []
+        for line, (level, title) in zip(self._heading_lines, self._headings):
+            if in_code_block(line) is None:
+                lines.append(line)
+                labels.append("    " * (level - 1) + title)
+        
+        outline["lines"] = lines
+        if labels != outline["labels"]:
+            listbox = outline["listbox"]
+            top = listbox.yview()[0]
+            listbox.delete(0, tk.END)
+            if labels:
+                listbox.insert(tk.END, *labels)
+            listbox.yview_moveto(top)
+            outline["labels"] = labels
+    
+    def jump_to_heading(self):
+        """把编辑器和预览滚动到大纲中选中的标题"""
+        outline = self._outline
+        selection = outline["listbox"].curselection()
+        if not selection:
+            return
+        # 列表可能还没有更新，先同步标题的行号
+        self.update_outline()
+        if selection[0] >= len(outline["lines"]):
+            return
+        line = outline["lines"][selection[0]]
+        
+        index = f"{line + 1}.0"
+        self.editor.mark_set(tk.INSERT, index)
+        self.editor.yview(index)
+        self.scroll_preview_to_line(line)
+    
+    def scroll_preview_to_line(self, line):
+        """把预览滚动到源文本第 line 行（从0开始）对应的位置
+        
+        按块的起始行号二分查找所在的块，块内按行数比例定位；块的起始标记由 Tk 维护位置，
+        不需要重新渲染，也不需要扫描预览内容。
+        """
+        blocks = self._preview_blocks
+        if self.preview is None or not blocks:
+            return
+        lines = self._preview_block_lines
+        block = max(bisect.bisect_right(lines, line) - 1, 0)
+        
+        start = int(self.preview.index(blocks[block]["mark"]).split(".")[0])
+        if block + 1 < len(blocks):
+            end = int(self.preview.index(blocks[block + 1]["mark"]).split(".")[0])
+            source_end = lines[block + 1]
+        else:
+            end = int(self.preview.index("end").split(".")[0])
+            source_end = int(self.editor.index("end").split(".")[0]) - 1
+        
+        fraction = min(max((line - lines[block]) / max(source_end - lines[block], 1), 0), 1)
+        self.preview.yview(f"{start + int(fraction * (end - start))}.0")
+    
+    def show_perf_panel(self):
+        """显示各阶段耗时统计的窗口，打开期间定时刷新"""
+        if self._perf_window is not None:
+            self._perf_window.lift()
+            return
+        
+        perf_window = tk.Toplevel(self.root)
+        perf_window.title("性能统计")
+        perf_window.geometry("640x480")
+        perf_window.transient(self.root)
+        
+        report = tk.Text(perf_window, wrap=tk.NONE, font=("Consolas", 10))
+        report.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        button_frame = ttk.Frame(perf_window)
+        button_frame.pack(pady=5)
+        ttk.Button(button_frame, text="重置", command=self._perf.reset).pack(side=tk.LEFT, padx=5)
+        
+        def refresh():
+            if self._perf_window is None:
+                return
+            report.config(state=tk.NORMAL)
+            report.delete("1.0", tk.END)
+            report.insert("1.0", self._perf.report())
+            report.config(state=tk.DISABLED)
+            perf_window.after(self.PERF_REFRESH_INTERVAL, refresh)
+        
+        def close_panel():
+            self._perf_window = None
+            perf_window.destroy()
+        
+        ttk.Button(button_frame, text="关闭", command=close_panel).pack(side=tk.LEFT, padx=5)
+        perf_window.protocol("WM_DELETE_WINDOW", close_panel)
+        self._perf_window = perf_window
+        refresh()
     
     def update_title(self):
-        """更新窗口标题"""
+        """更新窗口标题和当前标签页的标题"""
         title = "Malemon"
+        name = "未命名"
         if self.current_file:
-            title = f"{os.path.basename(self.current_file)} - {title}"
+            name = os.path.basename(self.current_file)
+            title = f"{name} - {title}"
         if self.is_modified:
             title = f"* {title}"
+            name = f"* {name}"
         self.root.title(title)
+        if self._active_tab is not None:
+            self.notebook.tab(self._active_tab["frame"], text=name)
     
     def on_closing(self):
         """窗口关闭时的处理"""
-        # 取消任何待处理的定时器
-        if self.after_id is not None:
-            self.root.after_cancel(self.after_id)
-        
-        if self.is_modified:
-            if self.ask_save_changes():
-                self.root.destroy()
-        else:
-            self.root.destroy()
+        # 等待后台保存写入完成
+        self.wait_for_save()
+        
+        # 依次切换到有未保存修改的标签页询问（切换标签页会取消正在打开的文件，
+        # 被取消的标签页是空白的未命名文档）
+        for tab in list(self._tabs):
+            modified = self.is_modified if tab is self._active_tab else tab["state"]["is_modified"]
+            if modified:
+                self.activate_tab(tab)
+                if not self.ask_save_changes():
+                    return
+        
+        # 确认关闭后再取消待处理的更新任务和正在打开的文件；取消关闭时文件继续读取
+        self._scheduler.cancel()
+        self.stop_loading()
+        
+        # 删除所有标签页的日志和临时文件
+        for tab in self._tabs:
+            if tab is not self._active_tab:
+                if tab["state"]["_journal_path"] is not None:
+                    self.queue_journal_task(("discard", tab["state"]["_journal_path"]))
+                if tab["spill"] is not None and os.path.exists(tab["spill"]):
+                    os.remove(tab["spill"])
+        self.discard_journal(wait=True)
+        self.save_highlight_cache()
+        self.root.destroy()
+    
+    def save_highlight_cache(self):
+        """把代码块高亮缓存保存到磁盘，下次打开文档时不必重新高亮"""
+        if not self._highlight_cache_path:
+            return
+        try:
+            HIGHLIGHT_CACHE.save(self._highlight_cache_path)
+        except OSError:
+            # 缓存只影响速度，保存失败不妨碍退出
+            pass
     
     def show_about(self):
         """显示关于对话框"""
@@ -662,7 +2603,18 @@ class MarkdownEditor:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Malemon Markdown 编辑器",
+                                     epilog="批量转换: malemon.py convert <目录> -o <输出目录> [-j N]")
+    parser.add_argument("--perf-log", metavar="PATH", default=os.environ.get("MALEMON_PERF_LOG"),
+                        help="把各阶段的耗时以 JSON lines 格式追加到文件（也可以设置环境变量 MALEMON_PERF_LOG）")
+    parser.add_argument("--highlight-cache", metavar="PATH", default=os.environ.get("MALEMON_HIGHLIGHT_CACHE"),
+                        help="在文件中保存代码块的高亮结果，下次启动时复用（也可以设置环境变量 MALEMON_HIGHLIGHT_CACHE）")
+    parser.add_argument("--measure-startup", action="store_true",
+                        help="输出从启动到窗口可以编辑的耗时后退出")
+    args = parser.parse_args()
+    
     enable_high_dpi_awareness()
     root = Window(themename="litera")
-    app = MarkdownEditor(root)
+    app = MarkdownEditor(root, perf_log=args.perf_log, measure_startup=args.measure_startup,
+                         highlight_cache=args.highlight_cache)
     root.mainloop()
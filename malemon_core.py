@@ -0,0 +1,476 @@
+"""Malemon 中不依赖图形界面的部分：Markdown 转换、块缓存、文件写入和批量转换
+
+批量转换: python malemon.py convert <目录> -o <输出目录> [-j N]
+"""
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+MARKDOWN_EXTENSIONS = [
+    'markdown.extensions.extra',
+    'markdown.extensions.codehilite',
+    'markdown.extensions.tables',
+    'markdown.extensions.fenced_code',
+    'markdown.extensions.nl2br'
+]
+
+
+# 拆分顶层块时使用的模式
+BLOCK_FENCE_PATTERN = re.compile(r'^[\t ]*(`{3,}|~{3,})')
+BLOCK_CONTINUE_PATTERN = re.compile(r'^(?:[\t ]|>|:|[*+-][\t ]|\d+\.[\t ])')
+BLOCK_LIST_PATTERN = re.compile(r'^ {0,3}(?:[*+-]|\d+\.)[\t ]')  # 缩进不超过3个空格的列表项
+BLOCK_HTML_PATTERN = re.compile(r'^<(!--|[A-Za-z][A-Za-z0-9-]*)')
+DEFINITION_PATTERN = re.compile(r'^(?: {0,3}\[[^\]^][^\]]*\]:|\*\[[^\]]+\]:)')
+DEFINITION_LIST_PATTERN = re.compile(r'^ {0,3}: {1,3}')  # 定义列表中的定义
+FOOTNOTE_PATTERN = re.compile(r'^\[\^[^\]]+\]:', re.MULTILINE)
+HTML_VOID_TAGS = {"area", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "wbr"}
+
+
+def split_markdown_blocks(text):
+    """把 Markdown 文本拆分为可以单独转换的顶层块
+    
+    块之间以空行分隔；代码块和 HTML 块内的空行、缩进的续行、
+    松散列表、连续的引用和定义列表的各项都保留在同一个块中。
+    返回 (块列表, 引用链接和缩写的定义文本, 各块起始行号的列表, 最后一个块是否为没有结束的 HTML 块)。
+    """
+    blocks = []
+    starts = []  # 各块第一行的行号（从0开始）
+    definitions = []
+    current = []
+    fence = None  # 当前代码块的围栏字符串
+    html_close = None  # 当前 HTML 块的结束标记
+    blank = False  # 上一行是否为空行
+    definition_list = False  # 当前块中是否有定义列表
+    lines = text.split("\n")
+    
+    for number, line in enumerate(lines):
+        if fence is not None:
+            current.append(line)
+            match = BLOCK_FENCE_PATTERN.match(line)
+            if match and match.group(1)[0] == fence[0] and len(match.group(1)) >= len(fence):
+                fence = None
+            continue
+        
+        if html_close is not None:
+            current.append(line)
+            if html_close in line:
+                html_close = None
+            continue
+        
+        if not line.strip():
+            blank = True
+            if current:
+                current.append(line)
+            continue
+        
+        if blank and current:
+            # 空行后的非续行开始新的块，但定义列表的下一项（空行后的术语）属于同一个列表。
+            # 引用链接和缩写的定义在转换时被移除，留在当前块中，不打断前后的列表项
+            starts_block = not BLOCK_CONTINUE_PATTERN.match(line) or (
+                BLOCK_LIST_PATTERN.match(line) and not ends_with_list(current))
+            if starts_block and not DEFINITION_PATTERN.match(line) and not (
+                    definition_list and continues_definition_list(lines, number)):
+                blocks.append("\n".join(current).rstrip())
+                current = []
+                definition_list = False
+        blank = False
+        
+        if DEFINITION_LIST_PATTERN.match(line):
+            definition_list = True
+        if DEFINITION_PATTERN.match(line):
+            definitions.append(line)
+        
+        match = BLOCK_FENCE_PATTERN.match(line)
+        if match:
+            fence = match.group(1)
+        elif not current:
+            match = BLOCK_HTML_PATTERN.match(line)
+            if match and match.group(1).lower() not in HTML_VOID_TAGS:
+                html_close = "-->" if match.group(1) == "!--" else f"</{match.group(1)}"
+                if html_close in line[match.end():]:
+                    html_close = None
+        if not current:
+            starts.append(number)
+        current.append(line)
+    
+    if current:
+        blocks.append("\n".join(current).rstrip())
+    return blocks, "\n".join(definitions), starts, html_close is not None
+
+
+def ends_with_list(lines):
+    """块的最后一个顶层元素是否为列表，空行后的列表项会并入这个列表
+    
+    列表、代码块和段落只能从块的开头、标题、代码块或定义之后开始；列表和段落中紧跟的行是续行，
+    空行后没有缩进的行结束列表。定义（引用链接和缩写）在转换时被移除，列表项以外的定义会把前后的行分开。
+    """
+    element = None  # 当前的顶层元素："list"、"code"、"heading" 或 "text"
+    blank = False
+    definition = False  # 上一个非空行是否为定义
+    for line in lines:
+        if not line.strip():
+            blank = True
+            continue
+        if DEFINITION_PATTERN.match(line):
+            definition = element != "list"
+            continue
+        starts = definition or element in (None, "code", "heading")  # 这一行不会是前一个元素的续行
+        definition = False
+        if line.startswith("#"):
+            element = "heading"
+        elif line.startswith(("    ", "\t")):
+            if starts or (blank and element == "text"):
+                element = "code"
+        elif BLOCK_LIST_PATTERN.match(line):
+            if starts:
+                element = "list"
+        elif starts or (blank and not line[:1].isspace()):
+            element = "text"
+        blank = False
+    return element == "list"
+
+
+def continues_definition_list(lines, start):
+    """空行后从 start 行开始的一段是否是定义列表的下一项
+    
+    这一段中有定义（以 ": " 开头的行），或者这一段是松散定义列表的术语（下一段以定义开头）。
+    """
+    number = start
+    while number < len(lines) and lines[number].strip():
+        if DEFINITION_LIST_PATTERN.match(lines[number]):
+            return True
+        number += 1
+    while number < len(lines) and not lines[number].strip():
+        number += 1
+    return number < len(lines) and bool(DEFINITION_LIST_PATTERN.match(lines[number]))
+
+
+def content_key(text):
+    """返回文本内容的哈希，用作缓存键"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def write_file_atomic(path, content):
+    """把内容完整写入磁盘后再替换目标文件，中途崩溃不会留下被截断的文件
+    
+    临时文件放在同一目录下，保证 os.replace 是原子的重命名。目标是符号链接时写入
+    链接指向的文件，链接本身保持不变。
+    """
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    temp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.urandom(4).hex()}.tmp")
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(path):
+            # 保留原文件的权限
+            os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    
+    # 让重命名本身也落盘（Windows 不支持打开目录）
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class HighlightCache:
+    """代码块高亮结果的缓存：按 (语言, 代码, 样式等选项) 的哈希查找，总大小超出上限时淘汰最久未用的
+    
+    渲染线程写入，主线程保存到磁盘，所以访问时需要加锁。
+    """
+    
+    MAX_SIZE = 8 * 1024 * 1024  # 缓存的 HTML 总字符数上限
+    
+    def __init__(self, max_size=MAX_SIZE):
+        self.lock = threading.Lock()
+        self.max_size = max_size
+        self.entries = OrderedDict()  # 哈希 -> HTML，最近使用的在最后
+        self.size = 0
+        self.modified = False  # 载入或保存之后是否有新的条目
+    
+    def get(self, key):
+        with self.lock:
+            html = self.entries.get(key)
+            if html is not None:
+                self.entries.move_to_end(key)
+            return html
+    
+    def put(self, key, html):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = html
+            self.size += len(html)
+            self.modified = True
+            while self.size > self.max_size and len(self.entries) > 1:
+                self.size -= len(self.entries.popitem(last=False)[1])
+    
+    @staticmethod
+    def version():
+        """Markdown 和 Pygments 的版本以及使用的扩展，任何一项不同时磁盘上的缓存不再适用"""
+        import markdown
+        import pygments
+        return [markdown.__version__, pygments.__version__, MARKDOWN_EXTENSIONS]
+    
+    def load(self, path):
+        """载入磁盘上的缓存，文件不存在、损坏或版本不同时忽略"""
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get("version") != self.version():
+            return
+        for key, html in data.get("entries", []):
+            self.put(bytes.fromhex(key), html)
+        self.modified = False
+    
+    def save(self, path):
+        """把缓存写入磁盘（按使用顺序，载入时保持淘汰顺序），没有新条目时不写入"""
+        with self.lock:
+            if not self.modified:
+                return
+            entries = [[key.hex(), html] for key, html in self.entries.items()]
+            self.modified = False
+        write_file_atomic(path, json.dumps({"version": self.version(), "entries": entries}, ensure_ascii=False))
+
+
+HIGHLIGHT_CACHE = HighlightCache()  # 进程内所有转换器共用的代码块高亮缓存
+
+
+def enable_highlight_cache():
+    """让 codehilite 和 fenced_code 扩展使用带缓存的 CodeHilite，未变化的代码块不再由 Pygments 重新分析"""
+    from markdown.extensions import codehilite, fenced_code
+    if getattr(codehilite.CodeHilite, "cached", False):
+        return
+    
+    class CachedCodeHilite(codehilite.CodeHilite):
+        cached = True
+        
+        def hilite(self, shebang=True):
+            # __init__ 从选项中取出的属性和剩下的 options（Pygments 样式、行号等）都影响输出；
+            # 这个类替换了整个进程中的 CodeHilite，配置不同的转换器也共用同一个缓存
+            key = content_key(repr((self.lang, self.guess_lang, self.use_pygments, self.lang_prefix,
+                                    self.pygments_formatter, self.src, shebang, sorted(self.options.items()))))
+            html = HIGHLIGHT_CACHE.get(key)
+            if html is None:
+                html = super().hilite(shebang)
+                HIGHLIGHT_CACHE.put(key, html)
+            return html
+    
+    codehilite.CodeHilite = fenced_code.CodeHilite = CachedCodeHilite
+
+
+class MarkdownRenderer:
+    """复用同一个 Markdown 转换器，并按顶层块缓存转换结果
+    
+    转换器不是线程安全的，一个实例只能在一个线程中使用。
+    """
+    
+    BLOCK_CACHE_SIZE = 4000  # 除当前文档的块以外，最多缓存的顶层块HTML数量
+    
+    def __init__(self):
+        self._markdown = None  # 复用的 Markdown 转换器
+        self._block_cache = OrderedDict()  # 顶层块内容哈希 -> HTML
+    
+    def get_converter(self):
+        """返回复用的 Markdown 转换器，第一次使用时才创建并加载扩展"""
+        if self._markdown is None:
+            # markdown 和扩展导入较慢，第一次转换时才导入
+            import markdown
+            enable_highlight_cache()
+            self._markdown = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+        return self._markdown
+    
+    def convert(self, text):
+        """整体转换一段 Markdown 文本"""
+        return self.get_converter().reset().convert(text)
+    
+    def render_blocks(self, text):
+        """将markdown按顶层块渲染，返回 (内容哈希, HTML, 块的起始行号) 列表"""
+        # 脚注需要在整个文档范围内编号，只能整体转换
+        if FOOTNOTE_PATTERN.search(text):
+            return [(content_key(text), self.convert(text), 0)]
+        
+        # 按顶层块转换，未变化的块直接使用缓存
+        blocks, definitions, starts, open_html = split_markdown_blocks(text)
+        # 没有结束的 HTML 块会把追加在后面的定义当作原样输出的文本，不追加定义
+        last = len(blocks) - 1 if open_html else None
+        rendered = [self.render_block(block, "" if number == last else definitions)
+                    for number, block in enumerate(blocks)]
+        
+        # 当前文档的块都刚被使用过，淘汰时只会移除文档中已经不存在的旧块
+        while len(self._block_cache) > len(blocks) + self.BLOCK_CACHE_SIZE:
+            self._block_cache.popitem(last=False)
+        return [(key, html, line) for (key, html), line in zip(rendered, starts) if html]
+    
+    def render_block(self, block, definitions):
+        """转换单个顶层块，返回 (内容哈希, HTML)，结果按内容哈希缓存（最近最少使用的先淘汰）"""
+        # 引用链接的定义会影响块的输出，一并计入缓存键
+        key = content_key(f"{definitions}\0{block}")
+        html = self._block_cache.get(key)
+        if html is not None:
+            self._block_cache.move_to_end(key)
+            return key, html
+        
+        source = f"{block}\n\n{definitions}" if definitions else block
+        html = self.convert(source)
+        self._block_cache[key] = html
+        return key, html
+
+
+MARKDOWN_SUFFIXES = (".md", ".markdown")  # 批量转换时处理的文件扩展名
+CONVERT_MANIFEST = ".malemon-convert.json"  # 输出目录中记录已转换文件的清单
+HTML_DOCUMENT = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+_worker_renderer = None  # 批量转换时每个工作进程复用的转换器
+
+
+def file_digest(data):
+    """返回文件内容的十六进制哈希，记录在转换清单中"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def convert_file(source, target, known_digest=None):
+    """把一个 Markdown 文件转换为 HTML 文件（在工作进程中运行）
+    
+    内容哈希与 known_digest 相同时不重新转换。
+    返回 (是否转换, 内容哈希, 修改时间, 文件大小)。
+    """
+    global _worker_renderer
+    # 先取文件状态再读取，读取期间的修改会在下次运行时被发现
+    stat = os.stat(source)
+    with open(source, 'rb') as file:
+        data = file.read()
+    digest = file_digest(data)
+    if digest == known_digest:
+        return False, digest, stat.st_mtime_ns, stat.st_size
+    
+    if _worker_renderer is None:
+        _worker_renderer = MarkdownRenderer()
+    body = _worker_renderer.convert(data.decode("utf-8"))
+    title = html.escape(os.path.splitext(os.path.basename(source))[0])
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    write_file_atomic(target, HTML_DOCUMENT.format(title=title, body=body))
+    return True, digest, stat.st_mtime_ns, stat.st_size
+
+
+def find_markdown_files(directory, exclude=None):
+    """返回目录下所有 Markdown 文件的相对路径（已排序），跳过 exclude 目录"""
+    paths = []
+    for parent, dirnames, filenames in os.walk(directory):
+        dirnames[:] = sorted(name for name in dirnames
+                             if os.path.realpath(os.path.join(parent, name)) != exclude)
+        for name in filenames:
+            if name.lower().endswith(MARKDOWN_SUFFIXES):
+                paths.append(os.path.relpath(os.path.join(parent, name), directory))
+    return sorted(paths)
+
+
+def load_convert_manifest(path):
+    """读取转换清单，转换扩展不同或文件损坏时返回空清单"""
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("extensions") != MARKDOWN_EXTENSIONS:
+        return {}
+    return manifest.get("files", {})
+
+
+def convert_main(argv=None):
+    """批量转换命令的入口，返回退出码"""
+    # 进程池会导入 multiprocessing，只在批量转换时才需要，不拖慢图形界面的启动
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    
+    parser = argparse.ArgumentParser(prog="malemon.py convert",
+                                     description="把目录中的 Markdown 文件批量转换为 HTML")
+    parser.add_argument("source", help="包含 Markdown 文件的目录")
+    parser.add_argument("-o", "--output", required=True, help="输出目录，保持源目录的结构")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="并行转换的进程数（默认为 CPU 核数）")
+    parser.add_argument("--force", action="store_true", help="忽略转换清单，重新转换所有文件")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.source):
+        parser.error(f"不是目录: {args.source}")
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("进程数必须大于 0")
+    
+    manifest_path = os.path.join(args.output, CONVERT_MANIFEST)
+    entries = {} if args.force else load_convert_manifest(manifest_path)
+    
+    # 修改时间和大小都没有变化的文件直接跳过；其余文件交给工作进程比较内容哈希
+    tasks = {}
+    skipped = 0
+    for relative in find_markdown_files(args.source, os.path.realpath(args.output)):
+        source = os.path.join(args.source, relative)
+        target = os.path.join(args.output, os.path.splitext(relative)[0] + ".html")
+        entry = entries.get(relative)
+        if entry is not None and not os.path.exists(target):
+            entry = None
+        stat = os.stat(source)
+        if entry is not None and (entry["mtime_ns"], entry["size"]) == (stat.st_mtime_ns, stat.st_size):
+            skipped += 1
+            continue
+        tasks[relative] = (source, target, entry["digest"] if entry is not None else None)
+    
+    converted = failed = 0
+    if tasks:
+        with ProcessPoolExecutor(max_workers=min(args.jobs or 1, len(tasks))) as pool:
+            futures = {pool.submit(convert_file, *task): relative for relative, task in tasks.items()}
+            # 每完成一个文件就输出一行，不等待全部完成
+            for future in as_completed(futures):
+                relative = futures[future]
+                try:
+                    changed, digest, mtime_ns, size = future.result()
+                except Exception as e:
+                    failed += 1
+                    entries.pop(relative, None)
+                    print(f"失败 {relative}: {e}", file=sys.stderr, flush=True)
+                    continue
+                entries[relative] = {"mtime_ns": mtime_ns, "size": size, "digest": digest}
+                if changed:
+                    converted += 1
+                    print(f"转换 {relative}", flush=True)
+                else:
+                    skipped += 1
+    
+    if tasks or not os.path.exists(manifest_path):
+        os.makedirs(args.output, exist_ok=True)
+        manifest = {"extensions": MARKDOWN_EXTENSIONS, "files": entries}
+        write_file_atomic(manifest_path, json.dumps(manifest, indent=1, ensure_ascii=False))
+    print(f"完成: 转换 {converted} 个, 未变化 {skipped} 个, 失败 {failed} 个", flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(convert_main())
@@ -0,0 +1,114 @@
+"""MarkdownEditor 中不需要窗口的逻辑的测试
+
+用法: python -m unittest discover tests（或 python -m pytest tests）
+"""
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import malemon
+from malemon import MarkdownEditor, TaskScheduler
+
+
+class FakeRoot:
+    """只记录 after 调度的 Tk 根窗口替身"""
+    
+    def __init__(self):
+        self.pending = {}
+        self.next_id = 0
+    
+    def after(self, delay, func, *args):
+        self.next_id += 1
+        self.pending[self.next_id] = (delay, func, args)
+        return self.next_id
+    
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+    
+    def after_cancel(self, after_id):
+        self.pending.pop(after_id, None)
+
+
+class TaskSchedulerTest(unittest.TestCase):
+    def test_delay_follows_reported_cost(self):
+        scheduler = TaskScheduler(FakeRoot())
+        scheduler.add("preview", lambda: None, 30, 2000, external_cost=True)
+        for _ in range(50):
+            scheduler.run("preview")
+            scheduler.report_cost("preview", 600)
+        # 同步部分几乎不耗时，不能把后台渲染的耗时拉低
+        self.assertAlmostEqual(scheduler.delay("preview"), 600 * TaskScheduler.COST_FACTOR, delta=1)
+    
+    def test_run_records_cost(self):
+        scheduler = TaskScheduler(FakeRoot())
+        scheduler.add("outline", lambda: None, 100, 5000)
+        scheduler.report_cost("outline", 1000)
+        scheduler.run("outline")
+        self.assertLess(scheduler.tasks["outline"]["cost"], 1000)
+    
+    def test_schedule_replaces_pending_task(self):
+        root = FakeRoot()
+        scheduler = TaskScheduler(root)
+        scheduler.add("status", lambda: None, 200)
+        scheduler.schedule("status")
+        scheduler.schedule("status")
+        self.assertEqual([delay for delay, _, _ in root.pending.values()], [200])
+        scheduler.cancel()
+        self.assertEqual(root.pending, {})
+
+
+class SaveWhileLoadingTest(unittest.TestCase):
+    def test_save_refused_while_loading(self):
+        # 读取到一半时编辑器只有部分内容，保存不能覆盖磁盘上的文件
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "doc.md")
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write("完整的内容")
+            
+            editor = MarkdownEditor.__new__(MarkdownEditor)
+            editor.current_file = path
+            with open(path, 'r', encoding='utf-8') as load_file:
+                editor._load_file = load_file
+                with mock.patch.object(malemon.messagebox, "showwarning") as warning, \
+                        mock.patch.object(malemon.filedialog, "asksaveasfilename") as dialog:
+                    self.assertIsNone(editor.save_file())
+                    self.assertIsNone(editor.save_file(wait=True))
+                    self.assertIsNone(editor.save_file_as())
+                self.assertEqual(warning.call_count, 3)
+                dialog.assert_not_called()
+            
+            with open(path, 'r', encoding='utf-8') as file:
+                self.assertEqual(file.read(), "完整的内容")
+
+
+
+class OutlineTest(unittest.TestCase):
+    def outline_lines(self, fence_lines):
+        editor = MarkdownEditor.__new__(MarkdownEditor)
+        editor._load_file = None
+        editor._outline = {"lines": [], "labels": ["旧的大纲"], "listbox": mock.Mock(**{"yview.return_value": (0, 1)})}
+        editor._heading_lines = [0, 2, 5]
+        editor._headings = [(1, "A"), (1, "in code"), (2, "B")]
+        editor._fence_lines = fence_lines
+        editor.update_heading_index = lambda: None
+        editor.update_outline()
+        return editor._outline["lines"]
+    
+    def test_headings_in_code_blocks_are_skipped(self):
+        self.assertEqual(self.outline_lines([1, 3]), [0, 5])
+    
+    def test_unclosed_fence_is_plain_text(self):
+        # 未闭合的围栏与高亮一致不视为代码块
+        self.assertEqual(self.outline_lines([1]), [0, 2, 5])
+        self.assertEqual(self.outline_lines([1, 3, 4]), [0, 5])
+    
+    def test_before_first_highlight(self):
+        self.assertEqual(self.outline_lines(None), [0, 2, 5])
+
+
+if __name__ == "__main__":
+    unittest.main()
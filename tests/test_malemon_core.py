@@ -0,0 +1,76 @@
+"""malemon_core 的测试：按顶层块渲染的结果必须与整体转换一致
+
+用法: python -m unittest discover tests（或 python -m pytest tests）
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from malemon_core import MarkdownRenderer, split_markdown_blocks
+
+# 覆盖各种块边界的示例文档
+SAMPLES = {
+    "段落和标题": "# Title\n\nSome *text* and **bold**.\n\nSetext\n======\n\nLast line",
+    "引用链接": "See [the site][1] and [x].\n\nMore [text][1].\n\n[1]: http://example.com\n[x]: http://x.org \"X\"\n",
+    "列表": "- a\n- b\n\n  continued\n\n- c\n\n1. one\n\n    indented\n\n2. two\n\ntext",
+    "引用": "> quote\n> more\n\n> second\n\nafter",
+    "代码块": "```python\nx = 1\n\ny = 2\n```\n\n~~~\n# not a heading\n\n~~~\n\n    indented code\n\n    more code\n\npara",
+    "表格": "| a | b |\n|---|---|\n| 1 | 2 |\n\npara",
+    "缩写": "*[HTML]: Hyper Text Markup Language\n\nHTML is here.\n\nAnd HTML again.",
+    "HTML 块": "<div>\n\n*not md*\n\n</div>\n\nafter\n\n<!-- comment\n\nstill comment -->\n\nend",
+    "没有结束的 HTML 块": "[1]: http://x\n\n<div>\nraw\n",
+    "定义列表": "Term\n: def\n\nTerm2\n: def2",
+    "松散定义列表": "Term\n\n: def\n\nTerm2\n\n: def2\n\nPara",
+    "定义列表后的段落": "Term\n: def\n\nPara one\n\nPara two",
+    "脚注": "Text[^1] and more[^2].\n\n[^1]: First.\n[^2]: Second.\n",
+    "列表项之间的定义": "- item [x][1]\n\n[1]: http://x\n\n- next\n",
+    "缩进的列表": "Para\n\n  - a\n\n- b\n",
+}
+
+
+def normalize(html):
+    """块之间的空行数不影响显示，比较时忽略空行"""
+    return [line for line in html.split("\n") if line]
+
+
+class RenderBlocksTest(unittest.TestCase):
+    def setUp(self):
+        self.renderer = MarkdownRenderer()
+    
+    def test_blocks_match_whole_document(self):
+        for name, text in SAMPLES.items():
+            with self.subTest(name):
+                whole = self.renderer.convert(text)
+                blocks = "\n".join(html for _, html, _ in self.renderer.render_blocks(text))
+                self.assertEqual(normalize(blocks), normalize(whole))
+    
+    def test_cached_blocks_match_after_edit(self):
+        # 修改一个块后，其余块来自缓存，结果仍与整体转换一致
+        text = SAMPLES["引用链接"] + "\n" + SAMPLES["列表"]
+        self.renderer.render_blocks(text)
+        edited = text.replace("More", "Much more")
+        blocks = "\n".join(html for _, html, _ in self.renderer.render_blocks(edited))
+        self.assertEqual(normalize(blocks), normalize(self.renderer.convert(edited)))
+
+
+class SplitMarkdownBlocksTest(unittest.TestCase):
+    def test_start_lines(self):
+        blocks, _, starts, _ = split_markdown_blocks("# A\n\npara\nline\n\n\n- x\n")
+        self.assertEqual(blocks, ["# A", "para\nline", "- x"])
+        self.assertEqual(starts, [0, 2, 6])
+    
+    def test_definition_list_items_stay_together(self):
+        blocks, _, _, _ = split_markdown_blocks("Term\n: def\n\nTerm2\n: def2\n\nPara")
+        self.assertEqual(blocks, ["Term\n: def\n\nTerm2\n: def2", "Para"])
+    
+    def test_open_html_block(self):
+        _, definitions, _, open_html = split_markdown_blocks("[1]: http://x\n\n<div>\nraw\n")
+        self.assertEqual(definitions, "[1]: http://x")
+        self.assertTrue(open_html)
+        self.assertFalse(split_markdown_blocks("<div>\nraw\n</div>\n")[3])
+
+
+if __name__ == "__main__":
+    unittest.main()
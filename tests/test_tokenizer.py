@@ -0,0 +1,41 @@
+"""tokenize_markdown 的测试：语法高亮使用的单次扫描分词
+
+用法: python -m unittest discover tests（或 python -m pytest tests）
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from malemon import tokenize_markdown
+
+
+def tokens(text):
+    """返回 (标签, 被标记的文本) 列表"""
+    return [(tag, text[start:end]) for tag, start, end in tokenize_markdown(text)]
+
+
+class TokenizeMarkdownTest(unittest.TestCase):
+    def test_emphasis(self):
+        self.assertEqual(tokens("**b** and *i* and ***bi*** and _u_ __ub__"), [
+            ("bold", "**b**"), ("italic", "*i*"), ("bold-italic", "***bi***"),
+            ("italic", "_u_"), ("bold", "__ub__"),
+        ])
+    
+    def test_header_and_quote_keep_inline_tokens(self):
+        self.assertEqual(tokens("# Head *it*"), [("header", "# Head *it*"), ("italic", "*it*")])
+        self.assertEqual(tokens("- item\n> q **b**"), [("list", "- "), ("quote", "> q **b**"), ("bold", "**b**")])
+    
+    def test_no_emphasis_inside_code_and_links(self):
+        self.assertEqual(tokens("`code *x*` [l](u)"), [("code_inline", "`code *x*`"), ("link", "[l](u)")])
+    
+    def test_code_block(self):
+        self.assertEqual(tokens("```\n# no\n*no*\n```\nafter *i*"),
+                         [("code_block", "```\n# no\n*no*\n```"), ("italic", "*i*")])
+        # 未闭合的围栏按普通文本处理
+        self.assertEqual(tokens("```\nunclosed *i*"), [("italic", "*i*")])
+
+
+if __name__ == "__main__":
+    unittest.main()